@@ -7,14 +7,18 @@ Compatível com analysis.py, charts.py e utils/formatting.py.
 from __future__ import annotations
 
 import re
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
+from importlib.util import find_spec
 from typing import Any, Dict, List, Tuple
 
 import numpy as np
 import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_string_dtype
 import warnings
 
-import os
 # Tenta importar funções do módulo 'ai.generative_llm'. Caso o pacote 'ai'
 # não exista, faz fallback para importar do módulo local 'generative_llm'.
 try:
@@ -28,7 +32,6 @@ from utils.columns import (
     get_col_material,
     get_col_quantidade,
     get_month_value_columns,
-    get_month_quantity_columns,
 )
 
 from utils.formatting import safe_format_currency, safe_format_number
@@ -38,23 +41,11 @@ warnings.filterwarnings("ignore")
 # ---------------------------------------------------------------------
 # Dependências opcionais (não obrigatórias para funcionar)
 # ---------------------------------------------------------------------
-try:
-    from sklearn.ensemble import IsolationForest
-    from sklearn.preprocessing import StandardScaler
-    from sklearn.linear_model import LinearRegression
-    from sklearn.metrics import mean_absolute_error
-
-    SKLEARN_AVAILABLE = True
-except Exception:
-    SKLEARN_AVAILABLE = False
-
-try:
-    from statsmodels.tsa.arima.model import ARIMA
-    from statsmodels.tsa.seasonal import seasonal_decompose
-
-    STATSMODELS_AVAILABLE = True
-except Exception:
-    STATSMODELS_AVAILABLE = False
+# Só verifica se os pacotes estão instalados, sem importá-los (sklearn e
+# statsmodels trazem o scipy junto e custam centenas de ms no import); quem
+# for usá-los importa dentro da própria função.
+SKLEARN_AVAILABLE = find_spec("sklearn") is not None
+STATSMODELS_AVAILABLE = find_spec("statsmodels") is not None
 
 # ---------------------------------------------------------------------
 # Helpers internos
@@ -69,16 +60,22 @@ def _month_columns_sorted(df: pd.DataFrame) -> List[str]:
     localizar colunas de valor mensais nos formatos suportados (ex. ``Valor Mês 01``
     ou ``Jan_Valor``). Se nenhuma coluna for encontrada, aplica a
     lógica anterior baseada em regex para manter compatibilidade com formatos
-    desconhecidos.
+    desconhecidos. A detecção depende só dos nomes das colunas e fica em
+    cache por conjunto de colunas.
     """
+    return list(_month_columns_for(tuple(df.columns)))
+
+
+@lru_cache(maxsize=64)
+def _month_columns_for(columns: Tuple[Any, ...]) -> Tuple[Any, ...]:
     # Tenta a detecção robusta
-    cols = get_month_value_columns(df)
+    cols = get_month_value_columns(pd.DataFrame(columns=list(columns)))
     if cols:
-        return cols
+        return tuple(cols)
 
     # Caso não encontre, usa a regex local para padrões antigos
     found: List[Tuple[int, str]] = []
-    for col in df.columns:
+    for col in columns:
         m = MONTH_RX.search(str(col))
         if m:
             try:
@@ -86,10 +83,10 @@ def _month_columns_sorted(df: pd.DataFrame) -> List[str]:
             except Exception:
                 pass
     if found:
-        return [col for _, col in sorted(found, key=lambda x: x[0])]
+        return tuple(col for _, col in sorted(found, key=lambda x: x[0]))
 
     # Fallback simples: qualquer coluna contendo 'mês' ou 'mes'
-    return [c for c in df.columns if "mês" in str(c).lower() or "mes" in str(c).lower()]
+    return tuple(c for c in columns if "mês" in str(c).lower() or "mes" in str(c).lower())
 
 
 def _filter_by_gerencia(df: pd.DataFrame, gerencia: str | None) -> pd.DataFrame:
@@ -108,36 +105,155 @@ def _filter_by_gerencia(df: pd.DataFrame, gerencia: str | None) -> pd.DataFrame:
     """
     col_g = get_col_gerencia(df)
     if gerencia is None:
-        out = df.copy()
-        if col_g:
-            out = out[~out[col_g].astype(str).str.lower().str.startswith("total")]
-        return out
+        if not col_g:
+            return df.copy()
+        return df[~df[col_g].astype(str).str.lower().str.startswith("total")].copy()
 
     if not col_g:
         return pd.DataFrame()
 
-    out = df[df[col_g].astype(str) == str(gerencia)].copy()
-    out = out[~out[col_g].astype(str).str.lower().str.startswith("total")]
-    return out
+    # As linhas da gerência têm todas o mesmo texto: ou nenhuma é linha de
+    # total ou todas são, então basta testar o nome pedido
+    if str(gerencia).lower().startswith("total"):
+        return df.iloc[0:0].copy()
+
+    col = df[col_g]
+    # Categorias (ver ``analysis._categorize``) comparam pelos códigos
+    textos = col.cat.categories if isinstance(col.dtype, pd.CategoricalDtype) else col
+    if isinstance(gerencia, str) and is_string_dtype(textos):
+        mask = col.eq(gerencia)  # já é texto: evita a cópia de astype(str)
+    else:
+        mask = col.astype(str) == str(gerencia)
+    return df[mask].copy()
+
 
+def _numeric_months(df_filtered: pd.DataFrame, month_cols: List[str]) -> pd.DataFrame:
+    """Colunas mensais convertidas para float numa só passada (não numéricos viram 0).
 
+    Só as colunas não numéricas (ex.: texto lido do CSV) passam por
+    ``pd.to_numeric``; as já numéricas vão direto para o cast.
+    """
+    meses = df_filtered[month_cols]
+    if not all(is_numeric_dtype(dt) for dt in meses.dtypes):
+        meses = meses.apply(lambda col: col if is_numeric_dtype(col.dtype) else pd.to_numeric(col, errors="coerce"))
+    return meses.astype(np.float64, copy=False).fillna(0.0)
+
+
+def _monthly_matrix(df_filtered: pd.DataFrame, num: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Soma os valores mensais por material com um único ``groupby``.
+
+    Args:
+        df_filtered: DataFrame já filtrado (fornece a coluna de material).
+        num: Colunas mensais numéricas, como em ``_numeric_months``.
+
+    Returns:
+        Tupla ``(materiais, valores)``: os materiais na ordem em que aparecem
+        e a matriz ``M x T`` (materiais x meses). Sem coluna de material,
+        ambos vêm vazios.
+    """
+    col_m = get_col_material(df_filtered)
+    if not col_m:
+        return np.empty(0, dtype=object), np.empty((0, num.shape[1]), dtype=np.float64)
+    sums = num.groupby(df_filtered[col_m], observed=True, sort=False).sum()
+    return sums.index.to_numpy(), sums.to_numpy(dtype=np.float64)
+
+
+@lru_cache(maxsize=128)
 def _label_from_col(col: str) -> str:
     """Converte o nome da coluna em rótulo de mês 'MM' quando possível."""
     m = MONTH_RX.search(str(col))
     return m.group(1).zfill(2) if m else str(col)
 
 
+@dataclass(frozen=True)
+class _AnalysisContext:
+    """Pré-processamento compartilhado pelas análises de uma gerência.
+
+    Montado uma vez por ``_build_context`` e repassado às análises (parâmetro
+    ``ctx``), que assim não repetem filtro, detecção de colunas, conversão
+    numérica e ``groupby`` por material.
+    """
+
+    df_filtered: pd.DataFrame
+    month_cols: List[str]
+    labels: Tuple[str, ...]      # rótulo 'MM' de cada coluna mensal
+    values: np.ndarray           # N x T: valores mensais numéricos por linha
+    material_index: np.ndarray   # M materiais, na ordem em que aparecem
+    material_values: np.ndarray  # M x T: valores mensais por material
+    material_totals: pd.Series   # M: soma dos meses, indexada pelo material
+    monthly_totals: np.ndarray   # T: soma de cada mês
+
+
+def _build_context(df: pd.DataFrame, gerencia: str | None) -> _AnalysisContext:
+    """Filtra a gerência e pré-calcula as agregações usadas pelas análises."""
+    df_filtered = _filter_by_gerencia(df, gerencia)
+    # Material como category: groupby e nunique passam a operar sobre códigos
+    # inteiros (a gerência já chega como category de ``analysis._categorize``)
+    col_m = get_col_material(df_filtered)
+    if col_m and df_filtered[col_m].dtype == object:
+        df_filtered[col_m] = df_filtered[col_m].astype("category")
+    month_cols = _month_columns_sorted(df_filtered)
+    num = _numeric_months(df_filtered, month_cols)
+    materiais, valores = _monthly_matrix(df_filtered, num)
+    values = num.to_numpy()
+    return _AnalysisContext(
+        df_filtered=df_filtered,
+        month_cols=month_cols,
+        labels=tuple(_label_from_col(c) for c in month_cols),
+        values=values,
+        material_index=materiais,
+        material_values=valores,
+        material_totals=pd.Series(valores.sum(axis=1), index=materiais),
+        monthly_totals=values.sum(axis=0),
+    )
+
+
 # ---------------------------------------------------------------------
 # Análise preditiva
 # ---------------------------------------------------------------------
-def predictive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict[str, Any]:
+def _linfit(y: np.ndarray) -> Tuple[float, float, float | None]:
+    """Reta de mínimos quadrados para ``y`` em x = 0..n-1, em forma fechada.
+
+    Returns:
+        Tupla ``(slope, intercept, r)``, com ``r`` o coeficiente de correlação
+        de Pearson (``None`` quando ``y`` é constante).
+    """
+    x = np.arange(len(y), dtype=float)
+    dx = x - x.mean()
+    dy = y - y.mean()
+    sxx = float(dx @ dx)
+    syy = float(dy @ dy)
+    sxy = float(dx @ dy)
+    slope = sxy / sxx
+    intercept = float(y.mean()) - slope * float(x.mean())
+    r = sxy / float(np.sqrt(sxx * syy)) if syy > 0 else None
+    return slope, intercept, r
+
+
+def _trend_fit(y: np.ndarray) -> Tuple[float, float, float | None, List[float], float]:
+    """Ajuste linear de ``y`` e extrapolação para os 3 meses seguintes.
+
+    Returns:
+        Tupla ``(slope, intercept, r, previsoes, media)``; ``r`` como em
+        ``_linfit``.
+    """
+    n = len(y)
+    slope, intercept, r = _linfit(y)
+    return slope, intercept, r, [slope * x + intercept for x in (n, n + 1, n + 2)], float(y.mean())
+
+
+def predictive_analysis(
+    df: pd.DataFrame, gerencia: str | None = None, ctx: _AnalysisContext | None = None
+) -> Dict[str, Any]:
     """
     Análise preditiva simples (tendência linear) para prever próximos 3 meses.
     Retorna previsões, tendência, confiança e valores históricos.
+    ``ctx`` reaproveita o pré-processamento de ``_build_context``.
     """
     try:
-        df_filtered = _filter_by_gerencia(df, gerencia)
-        if df_filtered.empty:
+        if ctx is None:
+            ctx = _build_context(df, gerencia)
+        if ctx.df_filtered.empty:
             return {
                 "status": "erro",
                 "mensagem": f"Nenhum dado encontrado para a gerência {gerencia}" if gerencia else "DataFrame vazio",
@@ -145,7 +261,7 @@ def predictive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict[s
                 "tendencia": "indefinida",
             }
 
-        month_cols = _month_columns_sorted(df_filtered)
+        month_cols = ctx.month_cols
         if len(month_cols) < 3:
             return {
                 "status": "erro",
@@ -155,13 +271,11 @@ def predictive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict[s
             }
 
         # Série histórica ordenada
-        y = np.array(
-            [pd.to_numeric(df_filtered[c], errors="coerce").fillna(0).sum() for c in month_cols],
-            dtype=float,
-        )
-        labels = [_label_from_col(c) for c in month_cols]
+        y = ctx.monthly_totals
+        labels = list(ctx.labels)
 
-        if len(y) < 2 or np.allclose(np.std(y), 0.0):
+        # len(y) >= 3 garantido acima; amplitude ~0 (relativa ao maior valor) = série constante
+        if np.ptp(y) <= 1e-9 * max(abs(float(y.max())), 1.0):
             # Sem variação: repete último valor
             return {
                 "status": "aviso",
@@ -172,21 +286,11 @@ def predictive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict[s
                 "labels_meses": labels,
             }
 
-        # Ajuste linear: y = a + b*x
-        x = np.arange(len(y), dtype=float)
-        b, a = np.polyfit(x, y, 1)  # retorna [slope, intercept] se usar np.polyfit(x, y, 1)? Cuidado: np.polyfit retorna [slope, intercept]
-        # CORREÇÃO: np.polyfit retorna [slope, intercept]; acima atribuímos b, a nessa ordem
-        slope = b
-        intercept = a
-
-        # Futuro: N, N+1, N+2
-        n = len(y)
-        x_future = np.array([n, n + 1, n + 2], dtype=float)
-        preds = (slope * x_future + intercept).tolist()
+        # Ajuste linear (y = intercept + slope*x) e previsões para N, N+1, N+2
+        slope, _, r, preds, mean_y = _trend_fit(y)
         preds = [float(max(0.0, p)) for p in preds]
 
         # Tendência baseada no slope relativo à média
-        mean_y = float(np.mean(y))
         rel = slope / (mean_y + 1e-9)
         if rel > 0.05:
             tendencia = "crescimento"
@@ -196,11 +300,7 @@ def predictive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict[s
             tendencia = "estável"
 
         # Confiança ~ força da correlação linear
-        if np.std(x) > 0 and np.std(y) > 0:
-            r = float(np.corrcoef(x, y)[0, 1])
-            confianca = max(0.3, min(0.95, abs(r)))
-        else:
-            confianca = 0.5
+        confianca = max(0.3, min(0.95, abs(r))) if r is not None else 0.5
 
         return {
             "status": "sucesso",
@@ -238,18 +338,72 @@ def _interpretar_previsao(previsoes: List[float], valor_atual: float, tendencia:
 # ---------------------------------------------------------------------
 # Detecção de anomalias
 # ---------------------------------------------------------------------
-def anomaly_detection(df: pd.DataFrame, gerencia: str | None = None) -> Dict[str, Any]:
+# Abaixo deste número de células o NumPy vence o custo de chamar o kernel Numba
+_NJIT_MIN_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def _zscore_kernel():
+    """Compila o kernel Numba de ``_zscores`` na primeira chamada.
+
+    O ``numba`` só é importado aqui, e apenas quando a matriz é grande o
+    bastante para compensar; retorna ``None`` sem o pacote instalado. Sem
+    ``parallel=True``: cada linha tem só ~12 meses, e o kernel é chamado de
+    várias threads ao mesmo tempo (ver ``_analysis_workers``), o que a camada
+    ``workqueue`` do Numba não suporta.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+
+    @njit
+    def _zscore_njit(values, z, mu):
+        for i in range(values.shape[0]):
+            m = values[i].mean()
+            sigma = values[i].std()
+            mu[i] = m
+            for t in range(values.shape[1]):
+                z[i, t] = abs((values[i, t] - m) / sigma) if sigma > 0 else 0.0
+
+    return _zscore_njit
+
+
+def _zscores(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Z-score absoluto de cada mês (M x T) e média de cada material (M).
+
+    Materiais sem variação ficam com z = 0. Em matrizes grandes usa o kernel
+    Numba, quando disponível.
+    """
+    kernel = _zscore_kernel() if values.size >= _NJIT_MIN_SIZE else None
+    if kernel is not None:
+        z = np.empty_like(values)
+        mu = np.empty(values.shape[0], dtype=values.dtype)
+        kernel(values, z, mu)
+        return z, mu
+    mu = values.mean(axis=1)
+    sigma = values.std(axis=1)[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.where(sigma > 0, np.abs((values - mu[:, None]) / sigma), 0.0)
+    return z, mu
+
+
+def anomaly_detection(
+    df: pd.DataFrame, gerencia: str | None = None, ctx: _AnalysisContext | None = None
+) -> Dict[str, Any]:
     """
     Detecção de anomalias estatísticas simples:
     - Z-score > 2 para série mensal por material
     - Crescimento súbito (>50%) entre meses consecutivos (total geral)
+    ``ctx`` reaproveita o pré-processamento de ``_build_context``.
     """
     try:
-        df_filtered = _filter_by_gerencia(df, gerencia)
-        if df_filtered.empty:
+        if ctx is None:
+            ctx = _build_context(df, gerencia)
+        if ctx.df_filtered.empty:
             return {"status": "erro", "mensagem": "Nenhum dado encontrado", "anomalias": []}
 
-        month_cols = _month_columns_sorted(df_filtered)
+        month_cols = ctx.month_cols
         if len(month_cols) < 3:
             return {
                 "status": "aviso",
@@ -260,50 +414,41 @@ def anomaly_detection(df: pd.DataFrame, gerencia: str | None = None) -> Dict[str
         anomalias: List[Dict[str, Any]] = []
 
         # Por material (usa detecção dinâmica da coluna de material)
-        col_m = get_col_material(df_filtered)
-        if col_m:
-            for material in df_filtered[col_m].dropna().unique():
-                mdf = df_filtered[df_filtered[col_m] == material]
-                serie = np.array(
-                    [pd.to_numeric(mdf[c], errors="coerce").fillna(0).sum() for c in month_cols],
-                    dtype=float,
+        if ctx.material_index.size:
+            valores = ctx.material_values
+            z, mu = _zscores(valores)
+            # Só as células atípicas viram dicionários (ordem: material, mês)
+            for i, idx in zip(*np.nonzero(z > 2.0)):
+                valor, media = float(valores[i, idx]), float(mu[i])
+                anomalias.append(
+                    {
+                        "tipo": "valor_atipico",
+                        "material": str(ctx.material_index[i]),
+                        "mes": ctx.labels[idx],
+                        "valor": valor,
+                        "valor_esperado": media,
+                        "desvio_percentual": float(((valor - media) / (abs(media) + 1e-9)) * 100.0),
+                        "severidade": "alta" if z[i, idx] > 3.0 else "média",
+                    }
                 )
-                mu, sigma = float(np.mean(serie)), float(np.std(serie))
-                if sigma > 0:
-                    for idx, valor in enumerate(serie):
-                        z = abs((valor - mu) / sigma)
-                        if z > 2.0:
-                            anomalias.append(
-                                {
-                                    "tipo": "valor_atipico",
-                                    "material": str(material),
-                                    "mes": _label_from_col(month_cols[idx]),
-                                    "valor": float(valor),
-                                    "valor_esperado": float(mu),
-                                    "desvio_percentual": float(((valor - mu) / (abs(mu) + 1e-9)) * 100.0),
-                                    "severidade": "alta" if z > 3.0 else "média",
-                                }
-                            )
 
         # Crescimento súbito no total geral
-        totais = [
-            float(pd.to_numeric(df_filtered[c], errors="coerce").fillna(0).sum()) for c in month_cols
-        ]
-        for i in range(1, len(totais)):
-            if totais[i - 1] > 0:
-                crescimento = ((totais[i] - totais[i - 1]) / totais[i - 1]) * 100.0
-                if crescimento > 50.0:
-                    anomalias.append(
-                        {
-                            "tipo": "crescimento_subito",
-                            "mes_anterior": _label_from_col(month_cols[i - 1]),
-                            "mes_atual": _label_from_col(month_cols[i]),
-                            "valor_anterior": float(totais[i - 1]),
-                            "valor_atual": float(totais[i]),
-                            "crescimento_percentual": float(crescimento),
-                            "severidade": "alta" if crescimento > 100.0 else "média",
-                        }
-                    )
+        totais = ctx.monthly_totals
+        anterior, atual = totais[:-1], totais[1:]
+        base = anterior > 0
+        crescimento = (atual - anterior) / np.where(base, anterior, 1.0) * 100.0
+        for i in np.flatnonzero(base & (crescimento > 50.0)):
+            anomalias.append(
+                {
+                    "tipo": "crescimento_subito",
+                    "mes_anterior": ctx.labels[i],
+                    "mes_atual": ctx.labels[i + 1],
+                    "valor_anterior": float(anterior[i]),
+                    "valor_atual": float(atual[i]),
+                    "crescimento_percentual": float(crescimento[i]),
+                    "severidade": "alta" if crescimento[i] > 100.0 else "média",
+                }
+            )
 
         return {
             "status": "sucesso",
@@ -321,8 +466,8 @@ def _interpretar_anomalias(anomalias: List[Dict[str, Any]]) -> str:
     if not anomalias:
         return "Nenhuma anomalia significativa detectada nos dados."
 
-    altas = sum(1 for a in anomalias if a.get("severidade") == "alta")
-    medias = sum(1 for a in anomalias if a.get("severidade") == "média")
+    severidades = Counter(a.get("severidade") for a in anomalias)
+    altas, medias = severidades["alta"], severidades["média"]
 
     partes = [f"Detectadas {len(anomalias)} anomalias"]
     if altas:
@@ -335,55 +480,66 @@ def _interpretar_anomalias(anomalias: List[Dict[str, Any]]) -> str:
 # ---------------------------------------------------------------------
 # Análise prescritiva
 # ---------------------------------------------------------------------
-def prescriptive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict[str, Any]:
+def _top_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """Índices dos ``k`` maiores valores, em ordem decrescente.
+
+    Seleção parcial (O(n)) em vez de ordenar tudo; só os candidatos são
+    ordenados. Empates mantêm a ordem em que os materiais aparecem.
+    """
+    n = values.size
+    if n > k:
+        corte = np.partition(values, n - k)[n - k]
+        idx = np.flatnonzero(values >= corte)
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(-values[idx], kind="stable")][:k]
+
+
+def prescriptive_analysis(
+    df: pd.DataFrame, gerencia: str | None = None, ctx: _AnalysisContext | None = None
+) -> Dict[str, Any]:
     """
     Recomendações de ações com base em:
     - Materiais com maior valor acumulado
     - Tendência recente da soma mensal
     - Valor total agregado (pode disparar auditoria)
+    ``ctx`` reaproveita o pré-processamento de ``_build_context``.
     """
     try:
-        df_filtered = _filter_by_gerencia(df, gerencia)
-        if df_filtered.empty:
+        if ctx is None:
+            ctx = _build_context(df, gerencia)
+        if ctx.df_filtered.empty:
             return {"status": "erro", "mensagem": "Nenhum dado encontrado", "recomendacoes": []}
 
-        month_cols = _month_columns_sorted(df_filtered)
+        month_cols = ctx.month_cols
         recomendacoes: List[Dict[str, Any]] = []
+        monthly_totals = ctx.monthly_totals.tolist()
 
         # Top materiais por valor (usa detecção dinâmica da coluna de material)
-        col_m = get_col_material(df_filtered)
-        if col_m and month_cols:
-            material_values: Dict[str, float] = {}
-            for material in df_filtered[col_m].dropna().unique():
-                mdf = df_filtered[df_filtered[col_m] == material]
-                total = 0.0
-                for c in month_cols:
-                    total += float(pd.to_numeric(mdf[c], errors="coerce").fillna(0).sum())
-                material_values[str(material)] = total
-
-            if material_values:
-                valores = list(material_values.values())
-                p80 = float(np.percentile(valores, 80)) if len(valores) >= 2 else max(valores)
-                top_materials = sorted(material_values.items(), key=lambda kv: kv[1], reverse=True)[:5]
-
-                for material, valor in top_materials:
-                    if valor > 0:
-                        prioridade = "alta" if valor >= p80 else "média"
-                        recomendacoes.append(
-                            {
-                                "tipo": "reducao_estoque",
-                                "prioridade": prioridade,
-                                "material": material,
-                                "valor_atual": float(valor),
-                                "acao": f"Priorizar redução do estoque de {material}",
-                                "detalhes": f"Material de alto impacto (atual: {safe_format_currency(valor)}). Considerar remanejamento ou liquidação.",
-                                "impacto_estimado": float(valor * (0.3 if prioridade == "alta" else 0.2)),
-                            }
-                        )
+        material_totals = ctx.material_totals
+        if len(material_totals) and month_cols:
+            valores = material_totals.to_numpy()
+            # np.percentile já usa seleção parcial (introselect), sem ordenar tudo
+            p80 = float(np.percentile(valores, 80)) if len(valores) >= 2 else float(valores.max())
+            top = _top_indices(valores, 5)
+
+            for material, valor in zip(map(str, material_totals.index[top]), valores[top].tolist()):
+                if valor > 0:
+                    prioridade = "alta" if valor >= p80 else "média"
+                    recomendacoes.append(
+                        {
+                            "tipo": "reducao_estoque",
+                            "prioridade": prioridade,
+                            "material": material,
+                            "valor_atual": float(valor),
+                            "acao": f"Priorizar redução do estoque de {material}",
+                            "detalhes": f"Material de alto impacto (atual: {safe_format_currency(valor)}). Considerar remanejamento ou liquidação.",
+                            "impacto_estimado": float(valor * (0.3 if prioridade == "alta" else 0.2)),
+                        }
+                    )
 
         # Tendência recente (média dos 3 últimos - média dos anteriores)
         if len(month_cols) >= 3:
-            monthly_totals = [float(pd.to_numeric(df_filtered[c], errors="coerce").fillna(0).sum()) for c in month_cols]
             ult3 = monthly_totals[-3:]
             ant = monthly_totals[:-3] or [0.0]
             recent_trend = float(np.mean(ult3) - np.mean(ant))
@@ -412,7 +568,7 @@ def prescriptive_analysis(df: pd.DataFrame, gerencia: str | None = None) -> Dict
         # Auditoria por valor total acumulado (último mês como referência principal)
         total_value = 0.0
         if month_cols:
-            total_value = float(pd.to_numeric(df_filtered[month_cols[-1]], errors="coerce").fillna(0).sum())
+            total_value = float(monthly_totals[-1])
             if total_value > 1_000_000:
                 recomendacoes.append(
                     {
@@ -450,29 +606,46 @@ def _interpretar_recomendacoes(recomendacoes: List[Dict[str, Any]]) -> str:
 # ---------------------------------------------------------------------
 # Resumo executivo em LN
 # ---------------------------------------------------------------------
-def generate_natural_language_summary(df: pd.DataFrame, gerencia: str | None = None) -> Dict[str, Any]:
+def _success_items(result: Dict[str, Any], key: str) -> List[Dict[str, Any]]:
+    """Lista ``key`` de um resultado de análise, ou vazia se não teve sucesso."""
+    return result.get(key, []) if result.get("status") == "sucesso" else []
+
+
+def generate_natural_language_summary(
+    df: pd.DataFrame,
+    gerencia: str | None = None,
+    ctx: _AnalysisContext | None = None,
+    *,
+    anomalies: List[Dict[str, Any]] | None = None,
+    recommendations: List[Dict[str, Any]] | None = None,
+) -> Dict[str, Any]:
     """
     Gera resumo executivo:
       - Se LLM habilitado: usa IA generativa (OpenAI)
       - Caso contrário: usa template determinístico (fallback)
+    ``ctx`` reaproveita o pré-processamento de ``_build_context``;
+    ``anomalies``/``recommendations``, quando informados, dispensam rodar
+    ``anomaly_detection``/``prescriptive_analysis`` de novo.
     """
     try:
-        df_filtered = _filter_by_gerencia(df, gerencia)
+        if ctx is None:
+            ctx = _build_context(df, gerencia)
+        df_filtered = ctx.df_filtered
         contexto = f"GERÊNCIA {gerencia.upper()}" if gerencia else "ORGANIZACIONAL"
         if df_filtered.empty:
             return {"status": "erro", "mensagem": "Nenhum dado encontrado para gerar resumo", "resumo": ""}
 
-        month_cols = _month_columns_sorted(df_filtered)
+        month_cols = ctx.month_cols
         if not month_cols:
             return {"status": "erro", "mensagem": "Nenhuma coluna de valor mensal encontrada", "resumo": ""}
 
         # Métricas base
-        monthly_totals = [float(pd.to_numeric(df_filtered[c], errors="coerce").fillna(0).sum()) for c in month_cols]
+        monthly_totals = ctx.monthly_totals.tolist()
         valor_atual = monthly_totals[-1] if monthly_totals else 0.0
         # Número de materiais e quantidade total com detecção dinâmica
-        col_m = get_col_material(df_filtered)
+        # (os grupos do groupby por material já são os materiais distintos)
         col_q = get_col_quantidade(df_filtered)
-        num_materials = int(df_filtered[col_m].nunique()) if col_m else 0
+        num_materials = len(ctx.material_totals)
         total_qty = int(pd.to_numeric(df_filtered[col_q], errors="coerce").fillna(0).sum()) if col_q else 0
 
         tendencia_texto = "estável"
@@ -486,26 +659,17 @@ def generate_natural_language_summary(df: pd.DataFrame, gerencia: str | None = N
 
         # Top material por soma (detecção dinâmica)
         top_material = "N/A"
-        col_m = get_col_material(df_filtered)
-        if col_m and month_cols:
-            material_values: Dict[str, float] = {}
-            for material in df_filtered[col_m].dropna().unique():
-                mdf = df_filtered[df_filtered[col_m] == material]
-                total = sum(float(pd.to_numeric(mdf[c], errors="coerce").fillna(0).sum()) for c in month_cols)
-                material_values[str(material)] = total
-            if material_values:
-                top_material = max(material_values.items(), key=lambda kv: kv[1])[0]
+        if len(ctx.material_totals):
+            top_material = str(ctx.material_totals.idxmax())
 
         # Dados auxiliares para o LLM (pega saídas das outras análises como insumo)
-        anomalias: List[Dict[str, Any]] = []
-        recs: List[Dict[str, Any]] = []
+        anomalias: List[Dict[str, Any]] = anomalies if anomalies is not None else []
+        recs: List[Dict[str, Any]] = recommendations if recommendations is not None else []
         try:
-            anom = anomaly_detection(df, gerencia)
-            if anom.get("status") == "sucesso":
-                anomalias = anom.get("anomalias", [])
-            presc = prescriptive_analysis(df, gerencia)
-            if presc.get("status") == "sucesso":
-                recs = presc.get("recomendacoes", [])
+            if anomalies is None:
+                anomalias = _success_items(anomaly_detection(df, gerencia, ctx=ctx), "anomalias")
+            if recommendations is None:
+                recs = _success_items(prescriptive_analysis(df, gerencia, ctx=ctx), "recomendacoes")
         except Exception:
             pass  # não bloqueia o resumo
 
@@ -541,8 +705,6 @@ def generate_natural_language_summary(df: pd.DataFrame, gerencia: str | None = N
             # se LLM falhar, seguimos para o fallback template
 
         # -------- Fallback: template determinístico (o que você já tinha) --------
-        from utils.formatting import safe_format_currency, safe_format_number
-
         resumo = f"""
 RESUMO EXECUTIVO - ESTOQUE EXCEDENTE {contexto}
 
@@ -591,12 +753,30 @@ def comprehensive_ai_analysis(df: pd.DataFrame, gerencia: str | None = None) ->
     Chaves retornadas:
       - analise_preditiva, deteccao_anomalias, analise_prescritiva, resumo_executivo
     """
+    # Filtro e agregações uma única vez para as quatro análises; se falhar,
+    # cada análise refaz o próprio pré-processamento e reporta o erro
+    try:
+        ctx = _build_context(df, gerencia)
+    except Exception:
+        ctx = None
+
     try:
+        preditiva = predictive_analysis(df, gerencia, ctx=ctx)
+        anomalias = anomaly_detection(df, gerencia, ctx=ctx)
+        prescritiva = prescriptive_analysis(df, gerencia, ctx=ctx)
+        # O resumo usa as anomalias e recomendações já calculadas acima
+        resumo = generate_natural_language_summary(
+            df,
+            gerencia,
+            ctx=ctx,
+            anomalies=_success_items(anomalias, "anomalias"),
+            recommendations=_success_items(prescritiva, "recomendacoes"),
+        )
         return {
-            "analise_preditiva": predictive_analysis(df, gerencia),
-            "deteccao_anomalias": anomaly_detection(df, gerencia),
-            "analise_prescritiva": prescriptive_analysis(df, gerencia),
-            "resumo_executivo": generate_natural_language_summary(df, gerencia),
+            "analise_preditiva": preditiva,
+            "deteccao_anomalias": anomalias,
+            "analise_prescritiva": prescritiva,
+            "resumo_executivo": resumo,
             "timestamp": datetime.now().isoformat(),
             "gerencia": gerencia or "Todas",
         }
@@ -1,24 +1,124 @@
 # src/ai/generative_llm.py
 from __future__ import annotations
 
+import json
 import os
-from typing import Any, Dict, Optional, List
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import blake2b
+from typing import Any, Dict, Optional, List, Tuple
 
 
 # Cliente oficial OpenAI (pip install openai)
 # Doc Chat Completions: https://platform.openai.com/docs/api-reference/chat
-# Importa cliente OpenAI de forma segura.
-# Caso a biblioteca 'openai' não esteja instalada, a variável ``OpenAI``
-# permanecerá ``None`` e as funções que dependem do cliente deverão lidar
-# com essa situação graciosamente.
-try:
-    from openai import OpenAI  # type: ignore
-except Exception:
-    OpenAI = None  # type: ignore
+# O SDK (httpx, pydantic...) leva ~0,5 s para importar e só é necessário
+# quando o LLM é de fato chamado; por isso é importado sob demanda em
+# ``_openai_cls``. Caso a biblioteca 'openai' não esteja instalada, a função
+# retorna ``None`` e as funções que dependem do cliente lidam com essa
+# situação graciosamente.
+@lru_cache(maxsize=1)
+def _openai_cls() -> Any:
+    try:
+        from openai import OpenAI  # type: ignore
+    except Exception:
+        return None
+    return OpenAI
+
 
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 # temperature baixa p/ resumo executivo mais estável
 DEFAULT_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.2"))
+# Limite de tokens da resposta: o resumo pedido (5–8 linhas + 3–5 ações)
+# cabe com folga em ~500; cada token gerado é um passo serial de decodificação
+DEFAULT_MAX_TOKENS = int(os.getenv("OPENAI_MAX_TOKENS", "500"))
+# Teto de tokens de saída do modelo (16.384 no gpt-4o-mini): o pedido
+# combinado de várias gerências é dividido para não passar dele
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("OPENAI_MAX_OUTPUT_TOKENS", "16384"))
+# Máximo de chamadas simultâneas ao LLM (ex.: resumos de várias gerências)
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("OPENAI_MAX_CONCURRENCY", "4")))
+# Novas tentativas do SDK em erros transitórios (429, 5xx, timeout, conexão),
+# com backoff exponencial e respeitando o Retry-After da API
+LLM_MAX_RETRIES = max(0, int(os.getenv("OPENAI_MAX_RETRIES", "5")))
+# Limita as chamadas simultâneas no processo, venham de onde vierem (threads
+# da análise, pedidos combinados), para rajadas não estourarem o limite de TPM
+_llm_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+
+# Cache das respostas do LLM: o mesmo prompt (mesmos dados da gerência),
+# modelo e parâmetros devolve o resumo já gerado, sem nova chamada à API
+# (ex.: reanálise do mesmo arquivo ou de gerências com dados idênticos).
+# LRU limitado, por um hash do pedido; só respostas com sucesso são guardadas.
+LLM_CACHE_SIZE = 128
+_response_cache: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+# Cache aproximado (opcional, OPENAI_NEAR_CACHE=1): além do pedido exato, a
+# resposta também é encontrada por uma assinatura arredondada dos dados
+# (valor em milhares de R$, variação com uma casa, tendência, material de
+# maior impacto e quantidade de anomalias/recomendações) da mesma gerência.
+# Diferenças de centavos deixam de gerar uma nova chamada, ao custo de o
+# texto citar os valores da análise anterior; por isso vem desligado.
+LLM_NEAR_CACHE = os.getenv("OPENAI_NEAR_CACHE", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _cache_key(request: Dict[str, Any]) -> bytes:
+    raw = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return blake2b(raw.encode("utf-8"), digest_size=16).digest()
+
+
+def _near_signature(ctx: _SummaryContext) -> Dict[str, Any]:
+    """Assinatura arredondada do contexto para o cache aproximado."""
+    return {
+        "gerencia": ctx.gerencia,
+        "valor_total": round(ctx.valor_total, -3),
+        "numero_materiais": ctx.numero_materiais,
+        "variacao_mensal": round(ctx.variacao_mensal, 1),
+        "tendencia": ctx.tendencia,
+        "top_material": ctx.top_material,
+        "n_anomalias": ctx.n_anomalias,
+        "n_recomendacoes": ctx.n_recomendacoes,
+    }
+
+
+def _cache_get(keys: List[bytes]) -> Optional[Dict[str, Any]]:
+    with _response_cache_lock:
+        for key in keys:
+            cached = _response_cache.get(key)
+            if cached is not None:
+                _response_cache.move_to_end(key)
+                return dict(cached)
+    return None
+
+
+def _cache_put(keys: List[bytes], result: Dict[str, Any]) -> None:
+    with _response_cache_lock:
+        for key in keys:
+            _response_cache[key] = result
+        while len(_response_cache) > LLM_CACHE_SIZE:
+            _response_cache.popitem(last=False)
+
+
+def clear_cache() -> None:
+    """Esvazia o cache de respostas do LLM."""
+    with _response_cache_lock:
+        _response_cache.clear()
+
+
+@lru_cache(maxsize=1)
+def _client_for(api_key: Optional[str]) -> Any:
+    return _openai_cls()(api_key=api_key, max_retries=LLM_MAX_RETRIES)
+
+
+def _get_client() -> Any:
+    """
+    Cliente OpenAI compartilhado pelo processo: reaproveita o pool de
+    conexões (keep-alive/TLS) entre chamadas e threads, em vez de abrir um
+    novo a cada resumo. Recriado se a OPENAI_API_KEY do ambiente mudar.
+    """
+    return _client_for(os.getenv("OPENAI_API_KEY"))
 
 
 def llm_enabled() -> bool:
@@ -39,10 +139,66 @@ def _fmt_currency_br(x: float) -> str:
         return "R$ 0,00"
 
 
-def _build_summary_prompt(payload: Dict[str, Any]) -> List[Dict[str, str]]:
+# Partes fixas do prompt, sem nenhum dado da gerência, sempre no início das
+# mensagens: o prefixo é idêntico em todas as chamadas e pode ser
+# reaproveitado pelo cache de prompt do provedor; os dados vêm por último.
+_SUMMARY_SYSTEM = (
+    "Você é um analista sênior de Supply Chain. Escreva em PT-BR, tom executivo, "
+    "parágrafos curtos e bullets quando ajudarem. Seja específico, cite números e percentuais."
+)
+_SUMMARY_TASK = """
+Tarefa:
+1) Produza um RESUMO EXECUTIVO objetivo (5–8 linhas).
+2) Liste 3–5 AÇÕES PRIORITÁRIAS (bullets), cada uma com racional curto e potencial impacto estimado.
+3) Se houver crescimento indesejado, reforce medidas de controle; se houver redução, aponte como sustentar.
+Respeite o dado: não invente números novos; use apenas os dados da análise abaixo.
+""".strip()
+# Bloco de dados de uma gerência, preenchido com os campos de
+# ``_SummaryContext`` (mais o valor total já formatado em R$)
+_SUMMARY_DATA_TMPL = """Contexto do negócio — GERÊNCIA: {gerencia}
+
+KPIs:
+• Valor total (mês atual ou mais recente): {valor_total_br}
+• Materiais: {numero_materiais}
+• Quantidade total: {quantidade_total}
+• Variação mensal: {variacao_mensal:+.1f}%
+• Tendência recente: {tendencia}
+• Material de maior impacto: {top_material}
+
+Anomalias (resumo):
+{anomalias_txt}
+
+Recomendações (resumo):
+{recomendacoes_txt}"""
+# Mensagem do usuário: tarefa fixa seguida do bloco de dados
+_SUMMARY_USER_TMPL = _SUMMARY_TASK + "\n\nDADOS DA ANÁLISE\n\n" + _SUMMARY_DATA_TMPL
+# Pedido combinado (várias gerências numa chamada): mesma tarefa, resposta
+# em JSON com um texto por identificador
+_SUMMARY_FUSED_TASK = _SUMMARY_TASK + """
+Faça isso para CADA gerência abaixo, separadamente. Responda apenas com um
+objeto JSON cujas chaves são os identificadores (ID) das gerências e cujos
+valores são o texto completo (resumo e ações) de cada uma."""
+
+
+@dataclass(frozen=True)
+class _SummaryContext:
+    """Campos do payload usados no prompt e no cache, extraídos uma vez."""
+    gerencia: str
+    valor_total: float
+    numero_materiais: Any
+    quantidade_total: int
+    variacao_mensal: float
+    tendencia: str
+    top_material: str
+    n_anomalias: int
+    n_recomendacoes: int
+    anomalias_txt: str
+    recomendacoes_txt: str
+
+
+def _extract_context(payload: Dict[str, Any]) -> _SummaryContext:
     """
-    Monta o prompt para o LLM a partir de métricas consolidadas.
-    Espera chaves:
+    Lê o payload consolidado da gerência. Espera chaves:
       payload = {
         "gerencia": str,
         "kpis": {"valor_total","numero_materiais","quantidade_total","variacao_mensal"},
@@ -52,10 +208,7 @@ def _build_summary_prompt(payload: Dict[str, Any]) -> List[Dict[str, str]]:
         "recomendacoes": List[Dict]
       }
     """
-    gerencia = payload.get("gerencia", "N/A")
     kpis = payload.get("kpis", {}) or {}
-    tendencia = payload.get("tendencia", "estável")
-    top_material = payload.get("top_material", "N/A")
 
     # Resumo curto das anomalias e recomendações
     anom = payload.get("anomalias") or []
@@ -69,39 +222,96 @@ def _build_summary_prompt(payload: Dict[str, Any]) -> List[Dict[str, str]]:
         for r in recs[:6]
     ) or "recomendações operacionais padrão"
 
-    system = (
-        "Você é um analista sênior de Supply Chain. Escreva em PT-BR, tom executivo, "
-        "parágrafos curtos e bullets quando ajudarem. Seja específico, cite números e percentuais."
+    return _SummaryContext(
+        gerencia=payload.get("gerencia", "N/A"),
+        valor_total=float(kpis.get("valor_total", 0) or 0),
+        numero_materiais=kpis.get("numero_materiais", 0),
+        quantidade_total=int(kpis.get("quantidade_total", 0) or 0),
+        variacao_mensal=float(kpis.get("variacao_mensal", 0) or 0),
+        tendencia=payload.get("tendencia", "estável"),
+        top_material=payload.get("top_material", "N/A"),
+        n_anomalias=len(anom),
+        n_recomendacoes=len(recs),
+        anomalias_txt=anom_txt,
+        recomendacoes_txt=recs_txt,
     )
-    user = f"""
-Contexto do negócio — GERÊNCIA: {gerencia}
 
-KPIs:
-• Valor total (mês atual ou mais recente): {_fmt_currency_br(kpis.get('valor_total', 0))}
-• Materiais: {kpis.get('numero_materiais', 0)}
-• Quantidade total: {int(kpis.get('quantidade_total', 0))}
-• Variação mensal: {kpis.get('variacao_mensal', 0):+.1f}%
-• Tendência recente: {tendencia}
-• Material de maior impacto: {top_material}
 
-Anomalias (resumo):
-{anom_txt}
+def _template_fields(ctx: _SummaryContext) -> Dict[str, Any]:
+    return {**vars(ctx), "valor_total_br": _fmt_currency_br(ctx.valor_total)}
 
-Recomendações (resumo):
-{recs_txt}
 
-Tarefa:
-1) Produza um RESUMO EXECUTIVO objetivo (5–8 linhas).
-2) Liste 3–5 AÇÕES PRIORITÁRIAS (bullets), cada uma com racional curto e potencial impacto estimado.
-3) Se houver crescimento indesejado, reforce medidas de controle; se houver redução, aponte como sustentar.
-Respeite o dado: não invente números novos; use apenas os acima.
-"""
+def _build_summary_prompt(ctx: _SummaryContext) -> List[Dict[str, str]]:
+    """Monta o prompt para o LLM a partir de métricas consolidadas."""
+    user = _SUMMARY_USER_TMPL.format_map(_template_fields(ctx))
     return [
-        {"role": "system", "content": system},
-        {"role": "user", "content": user.strip()},
+        {"role": "system", "content": _SUMMARY_SYSTEM},
+        {"role": "user", "content": user},
     ]
 
 
+def _summary_request(ctx: _SummaryContext) -> Tuple[Dict[str, Any], List[bytes]]:
+    """Parâmetros do pedido ao Chat Completions e suas chaves no cache."""
+    request = {
+        "model": DEFAULT_MODEL,
+        "messages": _build_summary_prompt(ctx),
+        "temperature": DEFAULT_TEMPERATURE,
+        "max_tokens": DEFAULT_MAX_TOKENS,
+    }
+    keys = [_cache_key(request)]
+    if LLM_NEAR_CACHE:
+        params = {k: v for k, v in request.items() if k != "messages"}
+        keys.append(_cache_key({**params, "assinatura": _near_signature(ctx)}))
+    return request, keys
+
+
+def _summary_result(texto: Optional[str], modelo: str, usage: Any = None) -> Dict[str, Any]:
+    """
+    Resultado de sucesso no formato usado pelo restante do app (dict, como as
+    demais análises): {status, resumo, modelo, tokens}. ``usage`` pode vir
+    como objeto do SDK, dict ou ``None``.
+    """
+    if usage is not None and hasattr(usage, "model_dump"):
+        usage = usage.model_dump()
+    return {
+        "status": "sucesso",
+        "resumo": (texto or "").strip(),
+        "modelo": modelo,
+        "tokens": usage,
+    }
+
+
+# Resumo fixo para gerências sem nada a analisar (valor, materiais e
+# quantidade zerados, sem anomalias): o LLM só repetiria que não há dados.
+_TRIVIAL_SUMMARY_TMPL = (
+    "RESUMO EXECUTIVO — GERÊNCIA: {gerencia}\n\n"
+    "Não há estoque excedente registrado no período analisado: valor total, "
+    "número de materiais e quantidade estão zerados, e nenhuma anomalia foi "
+    "detectada.\n\n"
+    "AÇÕES PRIORITÁRIAS:\n"
+    "• Manter o monitoramento regular e confirmar se a base da gerência está completa."
+)
+
+
+def _is_trivial(ctx: _SummaryContext) -> bool:
+    """Análise sem estoque, materiais nem anomalias: não há o que resumir."""
+    return (
+        ctx.valor_total == 0
+        and not ctx.numero_materiais
+        and ctx.quantidade_total == 0
+        and ctx.n_anomalias == 0
+    )
+
+
+def _trivial_result(ctx: _SummaryContext) -> Dict[str, Any]:
+    return {
+        "status": "sucesso",
+        "resumo": _TRIVIAL_SUMMARY_TMPL.format(gerencia=ctx.gerencia),
+        "modelo": None,
+        "tokens": None,
+    }
+
+
 def generate_executive_summary_llm(payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     Gera texto executivo com LLM. Retorna {status, resumo, modelo, usage?}
@@ -112,28 +322,27 @@ def generate_executive_summary_llm(payload: Dict[str, Any]) -> Dict[str, Any]:
         return {"status": "skip", "mensagem": "LLM desabilitado ou sem OPENAI_API_KEY."}
 
     # Verifica se a biblioteca openai está disponível
-    if OpenAI is None:
+    if _openai_cls() is None:
         return {"status": "erro", "mensagem": "Biblioteca openai não instalada."}
 
-    # Cria cliente e monta prompt
-    client = OpenAI()  # usa OPENAI_API_KEY do ambiente
-    messages = _build_summary_prompt(payload)
+    # Sem estoque nem sinais a comentar, o texto é fixo: não chama a API
+    ctx = _extract_context(payload)
+    if _is_trivial(ctx):
+        return _trivial_result(ctx)
 
-    # === Opção A: Chat Completions (estável e simples) ===
-    resp = client.chat.completions.create(
-        model=DEFAULT_MODEL,
-        messages=messages,
-        temperature=DEFAULT_TEMPERATURE,
-        max_tokens=700,
-    )
-    text = (resp.choices[0].message.content or "").strip()
+    # Monta o pedido; se o mesmo pedido já foi respondido, reaproveita
+    request, keys = _summary_request(ctx)
+    cached = _cache_get(keys)
+    if cached is not None:
+        return cached
 
-    return {
-        "status": "sucesso",
-        "resumo": text,
-        "modelo": DEFAULT_MODEL,
-        "tokens": getattr(resp, "usage", None).model_dump() if hasattr(resp, "usage") else None,
-    }
+    # === Opção A: Chat Completions (estável e simples) ===
+    client = _get_client()  # usa OPENAI_API_KEY do ambiente
+    with _llm_slots:
+        resp = client.chat.completions.create(**request)
+    result = _summary_result(resp.choices[0].message.content, DEFAULT_MODEL, getattr(resp, "usage", None))
+    _cache_put(keys, result)
+    return dict(result)
 
     # === Opção B: Responses API (alternativa moderna) ===
     # from openai import OpenAI
@@ -141,7 +350,89 @@ def generate_executive_summary_llm(payload: Dict[str, Any]) -> Dict[str, Any]:
     #     model=DEFAULT_MODEL,
     #     input=messages,  # mesmo formato role/content é aceito
     #     temperature=DEFAULT_TEMPERATURE,
-    #     max_output_tokens=700,
+    #     max_output_tokens=DEFAULT_MAX_TOKENS,
     # )
     # text = (r.output_text or "").strip()
-    # return {"status": "sucesso", "resumo": text, "modelo": DEFAULT_MODEL}
\ No newline at end of file
+    # return {"status": "sucesso", "resumo": text, "modelo": DEFAULT_MODEL}
+
+
+# ---------------------------------------------------------------------
+# Pedido combinado (várias gerências numa única chamada)
+# ---------------------------------------------------------------------
+def _fused_request(pendentes: Dict[str, _SummaryContext]) -> Dict[str, Dict[str, Any]]:
+    """Uma chamada combinada para ``pendentes``; {id: resultado}."""
+    blocos = "\n\n".join(
+        f"### ID: {custom_id}\n" + _SUMMARY_DATA_TMPL.format_map(_template_fields(ctx))
+        for custom_id, ctx in pendentes.items()
+    )
+    request = {
+        "model": DEFAULT_MODEL,
+        "messages": [
+            {"role": "system", "content": _SUMMARY_SYSTEM},
+            {"role": "user", "content": _SUMMARY_FUSED_TASK + "\n\nDADOS DAS ANÁLISES\n\n" + blocos},
+        ],
+        "temperature": DEFAULT_TEMPERATURE,
+        "max_tokens": min(DEFAULT_MAX_TOKENS * len(pendentes), LLM_MAX_OUTPUT_TOKENS),
+        "response_format": {"type": "json_object"},
+    }
+    keys = [_cache_key(request)]
+    cached = _cache_get(keys)
+    if cached is None:
+        client = _get_client()
+        with _llm_slots:
+            resp = client.chat.completions.create(**request)
+        try:
+            textos = json.loads(resp.choices[0].message.content or "{}")
+        except json.JSONDecodeError:
+            textos = {}
+        cached = {"textos": textos if isinstance(textos, dict) else {}}
+        if cached["textos"]:
+            _cache_put(keys, cached)
+
+    resultados: Dict[str, Dict[str, Any]] = {}
+    for custom_id in pendentes:
+        texto = cached["textos"].get(str(custom_id))
+        if isinstance(texto, str) and texto.strip():
+            resultados[custom_id] = _summary_result(texto, DEFAULT_MODEL)
+        else:
+            resultados[custom_id] = {"status": "erro", "mensagem": "Gerência ausente na resposta combinada."}
+    return resultados
+
+
+def generate_executive_summaries_llm_fused(payloads: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Gera os resumos de várias gerências numa única chamada, com resposta em
+    JSON ({id: texto}): um round-trip e um único envio das instruções fixas,
+    em vez de um por gerência. Útil para poucas gerências pequenas; para
+    muitas, a geração de um texto longo é serial e as chamadas paralelas
+    de ``generate_executive_summary_llm`` terminam antes. Acima de
+    ``LLM_MAX_OUTPUT_TOKENS // DEFAULT_MAX_TOKENS`` gerências, o pedido é
+    dividido em várias chamadas.
+
+    Retorna {id: resultado} no formato de ``generate_executive_summary_llm``;
+    ids ausentes na resposta vêm com status "erro".
+    """
+    if not payloads:
+        return {}
+    if not llm_enabled():
+        return {k: {"status": "skip", "mensagem": "LLM desabilitado ou sem OPENAI_API_KEY."} for k in payloads}
+    if _openai_cls() is None:
+        return {k: {"status": "erro", "mensagem": "Biblioteca openai não instalada."} for k in payloads}
+
+    # Gerências sem nada a analisar recebem o resumo fixo e ficam fora do pedido
+    contextos = {k: _extract_context(p) for k, p in payloads.items()}
+    resultados: Dict[str, Dict[str, Any]] = {
+        k: _trivial_result(ctx) for k, ctx in contextos.items() if _is_trivial(ctx)
+    }
+    pendentes = {k: ctx for k, ctx in contextos.items() if k not in resultados}
+    if not pendentes:
+        return resultados
+
+    # Cada gerência reserva DEFAULT_MAX_TOKENS da resposta; acima do teto de
+    # saída do modelo a API recusa o pedido, então vai em partes
+    por_pedido = max(1, LLM_MAX_OUTPUT_TOKENS // DEFAULT_MAX_TOKENS)
+    ids = list(pendentes)
+    for inicio in range(0, len(ids), por_pedido):
+        parte = {k: pendentes[k] for k in ids[inicio:inicio + por_pedido]}
+        resultados.update(_fused_request(parte))
+    return {k: resultados[k] for k in payloads}
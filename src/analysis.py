@@ -9,22 +9,13 @@ Análise unificada de estoque excedente por gerência:
 
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, Dict, List, Tuple, Optional
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Optional
 
-import numpy as np  # (pode ser útil em futuras expansões; ok manter)
 import pandas as pd
 
 
-# IA clássica (mantenha caminho conforme sua estrutura)
-# Tenta importar a partir do pacote 'ai.classic_ai'. Caso não exista,
-# faz fallback para importar do módulo local 'classic_ai'. Essa abordagem
-# evita erros de importação quando o projeto não está estruturado como pacote.
-try:
-    from ai.classic_ai import comprehensive_ai_analysis  # type: ignore
-except ImportError:
-    from classic_ai import comprehensive_ai_analysis  # type: ignore
-
 # Utilitários para identificação dinâmica de colunas
 from utils.columns import (
     get_col_gerencia,
@@ -48,6 +39,47 @@ from utils.columns import (
 # valores e quantidades por mês. Assim, não há necessidade de manter
 # uma função local `_month_columns_sorted` aqui.
 
+# Função de IA clássica, resolvida na primeira análise (ver ``_ai_analysis``).
+_comprehensive_ai_analysis = None
+
+
+def _ai_analysis():
+    """Retorna ``comprehensive_ai_analysis``, importando a IA clássica sob demanda.
+
+    O import é adiado até a primeira análise para não pesar na inicialização
+    de quem só importa este módulo. A função resolvida fica guardada em
+    ``_comprehensive_ai_analysis`` para as chamadas seguintes.
+    """
+    global _comprehensive_ai_analysis
+    if _comprehensive_ai_analysis is None:
+        # IA clássica (mantenha caminho conforme sua estrutura)
+        # Tenta importar a partir do pacote 'ai.classic_ai'. Caso não exista,
+        # faz fallback para importar do módulo local 'classic_ai'. Essa abordagem
+        # evita erros de importação quando o projeto não está estruturado como pacote.
+        try:
+            from ai.classic_ai import comprehensive_ai_analysis  # type: ignore
+        except ImportError:
+            from classic_ai import comprehensive_ai_analysis  # type: ignore
+        _comprehensive_ai_analysis = comprehensive_ai_analysis
+    return _comprehensive_ai_analysis
+
+
+def _analysis_workers(n_gerencias: int) -> int:
+    """Threads para analisar as gerências: mais de uma só com o LLM ativo.
+
+    Com a IA generativa, quase todo o tempo de cada gerência é espera pela
+    resposta da API (fora do GIL), então os resumos são pedidos em paralelo,
+    até ``LLM_MAX_CONCURRENCY``. Sem ela, as análises são só CPU (pandas) e
+    seguem sequenciais.
+    """
+    try:
+        from ai.generative_llm import LLM_MAX_CONCURRENCY, llm_enabled  # type: ignore
+    except ImportError:
+        from generative_llm import LLM_MAX_CONCURRENCY, llm_enabled  # type: ignore
+    if not llm_enabled():
+        return 1
+    return min(LLM_MAX_CONCURRENCY, n_gerencias)
+
 
 def get_unique_gerencias(df: pd.DataFrame) -> List[str]:
     """Retorna a lista de gerências distintas, excluindo linhas agregadas.
@@ -65,12 +97,34 @@ def get_unique_gerencias(df: pd.DataFrame) -> List[str]:
     col_g = get_col_gerencia(df)
     if not col_g:
         return []
-    vals = df[col_g].dropna().map(str).tolist()
+    # ``unique`` opera sobre os códigos quando a coluna é categórica
+    vals = {str(g) for g in df[col_g].dropna().unique()}
     # Remove valores que parecem ser totais agregados
-    vals = [g for g in set(vals) if not g.lower().startswith("total")]
+    vals = [g for g in vals if not g.lower().startswith("total")]
     return sorted(vals)
 
 
+def partition_by_gerencia(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """Separa o DataFrame em um sub-DataFrame por gerência, em uma única passada.
+
+    As chaves são os nomes das gerências como texto (o mesmo formato de
+    ``get_unique_gerencias``); linhas sem gerência ficam de fora. Passar o
+    sub-DataFrame às funções por gerência faz com que o filtro interno
+    percorra apenas as linhas daquela gerência, e não a base inteira.
+
+    Args:
+        df: DataFrame analisado.
+
+    Returns:
+        Dicionário ``gerencia -> sub-DataFrame``. Vazio se não houver coluna
+        de gerência.
+    """
+    col_g = get_col_gerencia(df)
+    if not col_g:
+        return {}
+    return {str(g): sub for g, sub in df.groupby(col_g, sort=False, observed=True)}
+
+
 def _filter(df: pd.DataFrame, gerencia: str) -> pd.DataFrame:
     """Filtra o DataFrame por uma gerência específica, excluindo totais.
 
@@ -94,6 +148,255 @@ def _filter(df: pd.DataFrame, gerencia: str) -> pd.DataFrame:
     return out
 
 
+def _num(s: pd.Series) -> pd.Series:
+    """Converte uma coluna para numérico, substituindo inválidos por 0.
+
+    Colunas já numéricas (inteiras ou float) não passam por
+    ``pd.to_numeric``; apenas têm os nulos preenchidos, quando existirem.
+    """
+    if s.dtype.kind in "iuf":
+        return s.fillna(0) if s.hasnans else s
+    return pd.to_numeric(s, errors="coerce").fillna(0)
+
+
+# ---------------------------------------------------------------------
+# Agregação incremental por gerência (leitura do CSV em blocos)
+# ---------------------------------------------------------------------
+
+# Número de linhas lidas por bloco em ``load_csv_with_totals``.
+CSV_CHUNKSIZE = 100_000
+
+# Colunas auxiliares do DataFrame de totais (além das colunas de valor mensal).
+_COL_QTD_TOTAL = "__quantidade_total"
+
+
+def _chunk_totals(chunk: pd.DataFrame) -> Tuple[Optional[pd.DataFrame], Optional[pd.DataFrame]]:
+    """Calcula as somas por gerência e os pares (gerência, material) de um bloco.
+
+    Linhas sem gerência ou cujo valor comece com "total" são descartadas,
+    replicando o critério de ``_filter``.
+
+    Args:
+        chunk: Bloco de linhas do CSV.
+
+    Returns:
+        Tupla ``(somas, pares)``. ``somas`` é indexado pela gerência e contém
+        as colunas de valor mensal e a quantidade total; ``pares`` contém os
+        pares distintos ``(gerencia, material)`` do bloco. Ambos são ``None``
+        quando o bloco não possui coluna de gerência.
+    """
+    col_g = get_col_gerencia(chunk)
+    if not col_g:
+        return None, None
+
+    chunk = chunk[chunk[col_g].notna()]
+    keys = chunk[col_g].astype(str)
+    valid = ~keys.str.lower().str.startswith("total")
+    chunk, keys = chunk[valid], keys[valid]
+
+    month_cols = get_month_value_columns(chunk)
+    numeric = chunk[month_cols].apply(_num)
+
+    # Quantidade consolidada ou somatório das quantidades mensais
+    col_q = get_col_quantidade(chunk)
+    q_cols = [col_q] if col_q else get_month_quantity_columns(chunk)
+    if q_cols:
+        qtd = chunk[q_cols].apply(_num).sum(axis=1)
+    else:
+        qtd = pd.Series(0.0, index=chunk.index)
+    numeric[_COL_QTD_TOTAL] = qtd
+
+    sums = numeric.groupby(keys, sort=False).sum()
+
+    pairs = None
+    col_m = get_col_material(chunk)
+    if col_m:
+        pairs = pd.DataFrame({"gerencia": keys, "material": chunk[col_m]})
+        pairs = pairs.dropna(subset=["material"]).drop_duplicates()
+    return sums, pairs
+
+
+def aggregate_gerencia_totals(chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Agrega, de forma incremental, os totais de cada gerência.
+
+    Cada bloco é reduzido a somas por gerência (``groupby``) e acumulado com
+    ``DataFrame.add(fill_value=0)``, de modo que apenas os totais parciais
+    permanecem em memória. O número de materiais distintos é obtido a partir
+    dos pares ``(gerencia, material)`` coletados em cada bloco.
+
+    Args:
+        chunks: Iterável de DataFrames (por exemplo, o leitor retornado por
+            ``pd.read_csv(..., chunksize=...)``). Um único DataFrame pode ser
+            passado como ``[df]``.
+
+    Returns:
+        DataFrame indexado pela gerência (ordenado), com as colunas de valor
+        mensal em ordem cronológica, ``quantidade_total`` e
+        ``numero_materiais``. Vazio quando não há gerências válidas.
+    """
+    acc: Optional[pd.DataFrame] = None
+    month_cols: List[str] = []
+    pairs: List[pd.DataFrame] = []
+
+    for chunk in chunks:
+        sums, chunk_pairs = _chunk_totals(chunk)
+        if sums is None:
+            continue
+        if not month_cols:
+            month_cols = get_month_value_columns(chunk)
+        acc = sums if acc is None else acc.add(sums, fill_value=0)
+        if chunk_pairs is not None:
+            pairs.append(chunk_pairs)
+
+    if acc is None:
+        return pd.DataFrame()
+
+    totals = acc[month_cols].copy()
+    totals["quantidade_total"] = acc[_COL_QTD_TOTAL]
+    if pairs:
+        materiais = pd.concat(pairs, ignore_index=True).drop_duplicates().groupby("gerencia").size()
+        totals["numero_materiais"] = materiais.reindex(totals.index).fillna(0).astype(int)
+    else:
+        totals["numero_materiais"] = 0
+    return totals.sort_index()
+
+
+def calculate_all_gerencias_kpis(totals: pd.DataFrame) -> pd.DataFrame:
+    """Calcula os KPIs de todas as gerências a partir dos totais agregados.
+
+    Produz os mesmos KPIs de ``calculate_gerencia_kpis``, porém para todas as
+    gerências de uma vez, usando o resultado de ``aggregate_gerencia_totals``.
+
+    Args:
+        totals: DataFrame retornado por ``aggregate_gerencia_totals``.
+
+    Returns:
+        DataFrame indexado pela gerência com as colunas ``valor_total``,
+        ``quantidade_total``, ``numero_materiais``, ``valor_medio_material`` e
+        ``variacao_mensal``.
+    """
+    kpi_cols = ["valor_total", "quantidade_total", "numero_materiais", "valor_medio_material", "variacao_mensal"]
+    if totals.empty:
+        return pd.DataFrame(columns=kpi_cols)
+
+    month_cols = [c for c in totals.columns if c not in ("quantidade_total", "numero_materiais")]
+    out = pd.DataFrame(index=totals.index)
+    out["valor_total"] = totals[month_cols[-1]] if month_cols else 0.0
+    out["quantidade_total"] = totals["quantidade_total"]
+    out["numero_materiais"] = totals["numero_materiais"]
+    out["valor_medio_material"] = out["valor_total"] / out["numero_materiais"].clip(lower=1)
+
+    # Variação mensal: compara primeiro e último mês de valor. Gerências com
+    # primeiro mês <= 0 viram NaN na divisão e recebem variação 0.
+    out["variacao_mensal"] = 0.0
+    if len(month_cols) >= 2:
+        primeiro = totals[month_cols[0]]
+        ultimo = totals[month_cols[-1]]
+        variacao = (ultimo - primeiro).div(primeiro.where(primeiro > 0)) * 100.0
+        out["variacao_mensal"] = variacao.fillna(0.0)
+    return out
+
+
+def _kpis_from_frame(kpi_df: pd.DataFrame, gerencia: str) -> Optional[Dict[str, Any]]:
+    """Extrai os KPIs de uma gerência do DataFrame de KPIs, no formato de
+    ``calculate_gerencia_kpis``. Retorna ``None`` se a gerência não existir."""
+    if gerencia not in kpi_df.index:
+        return None
+    row = kpi_df.loc[gerencia]
+    return {
+        "valor_total": float(row["valor_total"]),
+        "quantidade_total": int(row["quantidade_total"]),
+        "numero_materiais": int(row["numero_materiais"]),
+        "valor_medio_material": float(row["valor_medio_material"]),
+        "variacao_mensal": float(row["variacao_mensal"]),
+        "status": "sucesso",
+    }
+
+
+def _csv_dtypes(header: pd.DataFrame) -> Dict[str, str]:
+    """Define os tipos das colunas numéricas a partir do cabeçalho do CSV.
+
+    As colunas de valor mensais são lidas como ``float64``, poupando a
+    inferência de tipos do ``pd.read_csv`` bloco a bloco. As de quantidade
+    ficam com a inferência, para que contagens inteiras continuem ``int64``.
+
+    Args:
+        header: DataFrame vazio contendo apenas as colunas do arquivo.
+
+    Returns:
+        Mapeamento ``coluna -> dtype`` para o argumento ``dtype`` do pandas.
+    """
+    return {c: "float64" for c in get_month_value_columns(header)}
+
+
+def _categorize(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte gerência e área para ``category``.
+
+    São colunas de baixa cardinalidade repetidas em todas as linhas; como
+    categorias ocupam bem menos memória que strings Python e tornam filtros
+    e ``unique`` operações sobre códigos inteiros.
+    """
+    for col in (get_col_gerencia(df), get_col_area(df)):
+        if col and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    return df
+
+
+def load_csv_with_totals(source: Any, chunksize: int = CSV_CHUNKSIZE, **read_kwargs: Any) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Lê um CSV em blocos, acumulando os totais por gerência durante a leitura.
+
+    A agregação de cada bloco ocorre logo após o seu parse, sem uma segunda
+    varredura do DataFrame completo. Os blocos são mantidos e concatenados
+    de propósito: a app precisa do DataFrame inteiro para as análises por
+    gerência, então o pico de memória é o do arquivo completo (mais a cópia
+    do ``concat``), não o de um bloco. A leitura em blocos reduz o trabalho,
+    não a memória. Quando ``dtype`` não é informado, o
+    cabeçalho é lido antes para tipar as colunas de valor mensais (ver
+    ``_csv_dtypes``); se alguma delas tiver conteúdo não numérico, a leitura
+    é refeita com inferência automática. Gerência e área são convertidas
+    para ``category`` ao final.
+
+    Args:
+        source: Caminho ou objeto arquivo aceito por ``pd.read_csv``.
+        chunksize: Número de linhas por bloco.
+        **read_kwargs: Argumentos adicionais repassados a ``pd.read_csv``.
+
+    Returns:
+        Tupla ``(df, totals)`` com o DataFrame completo e o resultado de
+        ``aggregate_gerencia_totals``.
+    """
+    chunks: List[pd.DataFrame] = []
+
+    def _collect(reader: Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+        for chunk in reader:
+            chunks.append(chunk)
+            yield chunk
+
+    def _rewind() -> None:
+        if hasattr(source, "seek"):
+            source.seek(0)
+
+    def _read(**kw: Any) -> pd.DataFrame:
+        chunks.clear()
+        with pd.read_csv(source, chunksize=chunksize, **kw) as reader:
+            return aggregate_gerencia_totals(_collect(reader))
+
+    if "dtype" in read_kwargs:
+        totals = _read(**read_kwargs)
+    else:
+        header = pd.read_csv(source, nrows=0, **read_kwargs)
+        _rewind()
+        try:
+            totals = _read(dtype=_csv_dtypes(header), **read_kwargs)
+        except ValueError:
+            # Coluna mensal com texto (ex.: "R$ 1.234,56"): volta à inferência
+            _rewind()
+            totals = _read(**read_kwargs)
+
+    df = _categorize(pd.concat(chunks, ignore_index=True)) if chunks else pd.DataFrame()
+    return df, totals
+
+
 # ---------------------------------------------------------------------
 # Cálculos por gerência
 # ---------------------------------------------------------------------
@@ -134,17 +437,17 @@ def calculate_gerencia_kpis(df: pd.DataFrame, gerencia: str) -> Dict[str, Any]:
     valor_total = 0.0
     if month_cols:
         last_col = month_cols[-1]
-        valor_total = pd.to_numeric(gdf[last_col], errors="coerce").fillna(0).sum()
+        valor_total = _num(gdf[last_col]).sum()
 
     # Quantidade total (consolidada ou somatório de quantidades mensais)
     col_q = get_col_quantidade(gdf)
     if col_q:
-        quantidade_total = pd.to_numeric(gdf[col_q], errors="coerce").fillna(0).sum()
+        quantidade_total = _num(gdf[col_q]).sum()
     else:
         quantidade_total = 0
         q_month_cols = get_month_quantity_columns(gdf)
         for qcol in q_month_cols:
-            quantidade_total += pd.to_numeric(gdf[qcol], errors="coerce").fillna(0).sum()
+            quantidade_total += _num(gdf[qcol]).sum()
 
     # Número de materiais distintos
     col_m = get_col_material(gdf)
@@ -156,8 +459,8 @@ def calculate_gerencia_kpis(df: pd.DataFrame, gerencia: str) -> Dict[str, Any]:
     # Variação mensal: compara primeiro e último mês de valor
     variacao_mensal = 0.0
     if len(month_cols) >= 2:
-        primeiro = pd.to_numeric(gdf[month_cols[0]], errors="coerce").fillna(0).sum()
-        ultimo   = pd.to_numeric(gdf[month_cols[-1]], errors="coerce").fillna(0).sum()
+        primeiro = _num(gdf[month_cols[0]]).sum()
+        ultimo   = _num(gdf[month_cols[-1]]).sum()
         if primeiro > 0:
             variacao_mensal = ((ultimo - primeiro) / primeiro) * 100.0
 
@@ -192,7 +495,7 @@ def get_monthly_evolution(df: pd.DataFrame, gerencia: str) -> List[Dict[str, Any
     month_cols = get_month_value_columns(gdf)
     out: List[Dict[str, Any]] = []
     for idx, col in enumerate(month_cols):
-        total = pd.to_numeric(gdf[col], errors="coerce").fillna(0).sum()
+        total = _num(gdf[col]).sum()
         # Determina o rótulo do mês (01..12) a partir do nome da coluna
         label: str
         m = MONTH_RX.search(str(col))
@@ -239,15 +542,17 @@ def get_top_materials(df: pd.DataFrame, gerencia: str, n: int = 10) -> List[Tupl
         return []
 
     month_cols = get_month_value_columns(gdf)
-    totals: Dict[str, float] = {}
 
-    # Itera sobre materiais únicos, convertendo para string para uniformizar
-    for mat in gdf[col_m].dropna().map(str).unique():
-        mat_df = gdf[gdf[col_m].astype(str) == mat]
-        v = 0.0
-        for c in month_cols:
-            v += pd.to_numeric(mat_df[c], errors="coerce").fillna(0).sum()
-        totals[mat] = float(v)
+    # Chave (material como string) e valor de cada linha calculados uma única
+    # vez; antes, a cada material a coluna inteira era convertida e filtrada
+    # de novo (custo materiais x linhas).
+    presentes = gdf[col_m].notna()
+    chave = gdf.loc[presentes, col_m].astype(str)
+    if month_cols:
+        valor_linha = gdf.loc[presentes, month_cols].apply(_num).sum(axis=1)
+    else:
+        valor_linha = pd.Series(0.0, index=chave.index)
+    totals = valor_linha.groupby(chave, sort=False).sum()
 
     top = sorted(totals.items(), key=lambda x: x[1], reverse=True)[: max(1, n)]
     return [(k, float(v)) for k, v in top]
@@ -292,7 +597,7 @@ def get_gerencia_data_table(df: pd.DataFrame, gerencia: str) -> List[Dict[str, A
         # Apenas converte para numérico colunas que não são categóricas
         if c not in (col_m, col_a) and c in table.columns:
             try:
-                table[c] = pd.to_numeric(table[c], errors="coerce").fillna(0)
+                table[c] = _num(table[c])
             except Exception:
                 # Quando pd.to_numeric não aceita o array diretamente (por exemplo,
                 # DataFrame em vez de Series), converte cada elemento individualmente.
@@ -349,15 +654,20 @@ def get_numeric_column_stats(df: pd.DataFrame, gerencia: str) -> Dict[str, Dict[
 # ---------------------------------------------------------------------
 # Análise completa por gerência e para todas as gerências
 # ---------------------------------------------------------------------
-def comprehensive_gerencia_analysis(df: pd.DataFrame, gerencia: str) -> Dict[str, Any]:
+def comprehensive_gerencia_analysis(
+    df: pd.DataFrame, gerencia: str, kpis: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
     """
     Pacote completo por gerência (KPIs, evolução, top materiais, tabela, IA).
+    Se ``kpis`` for informado (ex.: extraído de ``calculate_all_gerencias_kpis``),
+    o cálculo individual dos KPIs é dispensado.
     """
-    kpis = calculate_gerencia_kpis(df, gerencia)
+    if kpis is None:
+        kpis = calculate_gerencia_kpis(df, gerencia)
     evolucao = get_monthly_evolution(df, gerencia)
     top = get_top_materials(df, gerencia, 10)
     tabela = get_gerencia_data_table(df, gerencia)
-    ai = comprehensive_ai_analysis(df, gerencia)
+    ai = _ai_analysis()(df, gerencia)
 
     # Estatísticas adicionais para todas as colunas numéricas
     numeric_stats = get_numeric_column_stats(df, gerencia)
@@ -375,10 +685,21 @@ def comprehensive_gerencia_analysis(df: pd.DataFrame, gerencia: str) -> Dict[str
     }
 
 
-def generate_all_gerencias_analysis(df: pd.DataFrame) -> Dict[str, Any]:
+def generate_all_gerencias_analysis(
+    df: pd.DataFrame,
+    totals: Optional[pd.DataFrame] = None,
+    progress: Optional[Callable[[int, int, str], None]] = None,
+) -> Dict[str, Any]:
     """
     Retorna o pacote de análises para TODAS as gerências, no formato
     esperado pela app e pelo gerador de PDF.
+
+    Os KPIs são calculados de uma só vez para todas as gerências e a base é
+    particionada por gerência antes das análises individuais. Se os totais
+    agregados já estiverem disponíveis (ex.: ``load_csv_with_totals``),
+    podem ser passados em ``totals`` para evitar uma nova varredura.
+    ``progress``, se informado, é chamado com ``(concluídas, total, gerência)``
+    a cada gerência analisada, sempre na thread de quem chamou.
     """
     gerencias = get_unique_gerencias(df)
     if not gerencias:
@@ -389,7 +710,26 @@ def generate_all_gerencias_analysis(df: pd.DataFrame) -> Dict[str, Any]:
             "analises": {},
         }
 
-    analises = {g: comprehensive_gerencia_analysis(df, g) for g in gerencias}
+    if totals is None:
+        totals = aggregate_gerencia_totals([df])
+    kpi_df = calculate_all_gerencias_kpis(totals)
+    partes = partition_by_gerencia(df)
+    tarefas = [(partes.get(g, df), g, _kpis_from_frame(kpi_df, g)) for g in gerencias]
+    workers = _analysis_workers(len(tarefas))
+    analises: Dict[str, Any] = {}
+
+    def _collect(resultados: Iterable[Dict[str, Any]]) -> None:
+        for g, resultado in zip(gerencias, resultados):
+            analises[g] = resultado
+            if progress is not None:
+                progress(len(analises), len(gerencias), g)
+
+    if workers > 1:
+        _ai_analysis()  # resolve o import antes das threads
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            _collect(ex.map(lambda t: comprehensive_gerencia_analysis(*t), tarefas))
+    else:
+        _collect(comprehensive_gerencia_analysis(*t) for t in tarefas)
 
     return {
         "status": "sucesso",
@@ -3,22 +3,48 @@ Módulo de geração de gráficos para análise de estoque excedente.
 Inclui visualizações específicas para dashboards por gerência.
 """
 
-from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from hashlib import blake2b
+from typing import Callable, Dict, Iterator, List, Any, Optional, Tuple
 import io
+import json
+import os
+import threading
 import warnings
 
 import numpy as np
+import matplotlib
+# Backend Agg explícito, antes do pyplot: os gráficos são só renderizados em
+# memória (app e PDF), então o pyplot não sonda backends de interface gráfica
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PatchCollection
+from matplotlib.figure import Figure
 from matplotlib.patches import Rectangle
-import seaborn as sns
+from matplotlib.ticker import FuncFormatter
+from matplotlib.transforms import ScaledTranslation
+
+# Plotly é opcional: só é usado na app quando CHART_BACKEND=plotly
+try:
+    import plotly.graph_objects as go
+    PLOTLY_AVAILABLE = True
+except Exception:
+    PLOTLY_AVAILABLE = False
 
 # >>> Importa formatações padronizadas dos utils
 from utils.formatting import (
     format_currency_compact,  # R$ 1.2K / R$ 3.4M
+    format_currency_compact_array,
     safe_format_number,       # 1.234.567
 )
 
-warnings.filterwarnings('ignore')
+# Avisos do matplotlib sobre o desenho (ex.: glifo ausente na fonte) são atribuídos a este módulo; só eles são silenciados,
+# sem esconder os avisos do restante do processo.
+warnings.filterwarnings('ignore', category=UserWarning, module=__name__)
 
 # ----------------------------------------------------------------------
 # Configurações globais
@@ -26,10 +52,43 @@ warnings.filterwarnings('ignore')
 plt.rcParams['font.family'] = 'DejaVu Sans'
 plt.rcParams['axes.unicode_minus'] = False
 
-def setup_plot_style():
-    """Configura estilo padrão para os gráficos."""
+# Resolução e formato das imagens (variáveis de ambiente CHART_DPI e
+# CHART_FORMAT, ex.: "webp"). As figuras têm 10-16 polegadas de largura e são
+# exibidas no navegador e no PDF com ~7 polegadas; 100 dpi já resultam em
+# ~170 dpi efetivos, e o custo de rasterizar/comprimir cresce com dpi².
+CHART_DPI = int(os.getenv('CHART_DPI', '100'))
+CHART_FORMAT = os.getenv('CHART_FORMAT', 'png').lower()
+# Gráficos dominados por áreas preenchidas (evolução mensal, dashboard) saem
+# em JPEG, que codifica ~2x mais rápido que o PNG (mesmo no nível 1) com
+# arquivos menores. Cards e barras, de cores chapadas, seguem CHART_FORMAT.
+FILLED_CHART_FORMAT = 'jpeg'
+# Opções do Pillow por formato. PNG com compressão zlib rápida (nível 1): a
+# codificação é a etapa mais cara do savefig e o ganho de tamanho do nível
+# padrão é pequeno; no PDF a imagem é recomprimida pelo ReportLab de qualquer
+# forma.
+_SAVE_KW: Dict[str, Dict[str, Any]] = {
+    'png': {'pil_kwargs': {'compress_level': 1}},
+    'jpeg': {'pil_kwargs': {'quality': 85, 'optimize': False, 'progressive': False}},
+}
+_SAVE_KW['jpg'] = _SAVE_KW['jpeg']
+# Gráficos exibidos no navegador: "matplotlib" (imagem) ou "plotly" (JSON
+# interativo, sem rasterização). O PDF usa sempre as imagens.
+CHART_BACKEND = os.getenv('CHART_BACKEND', 'matplotlib').lower()
+
+_STYLE_INITIALIZED = False
+_STYLE_LOCK = threading.Lock()
+
+def _sns():
+    """Importa o seaborn sob demanda: é usado só para a paleta e seu import
+    (com scipy) é a maior parte do tempo de importação deste módulo."""
+    import seaborn as sns
+    return sns
+
+def _init_style():
+    """Aplica o estilo padrão dos gráficos (estilo, paleta e rcParams)."""
+    global _STYLE_INITIALIZED
     plt.style.use('default')
-    sns.set_palette("husl")
+    _sns().set_palette("husl")
     plt.rcParams.update({
         'font.size': 10,
         'axes.titlesize': 14,
@@ -39,301 +98,646 @@ def setup_plot_style():
         'legend.fontsize': 10,
         'figure.titlesize': 16
     })
+    _STYLE_INITIALIZED = True
+
+def setup_plot_style():
+    """Configura estilo padrão para os gráficos (uma única vez por processo)."""
+    if not _STYLE_INITIALIZED:
+        with _STYLE_LOCK:
+            if not _STYLE_INITIALIZED:
+                _init_style()
+
+def _new_figure(figsize: Tuple[float, float], **kwargs: Any) -> Figure:
+    """
+    Cria uma figura Agg fora do pyplot. O estilo é aplicado aqui, na primeira
+    figura, e não no import do módulo (quem só usa o Plotly não paga por ele).
+    """
+    setup_plot_style()
+    fig = Figure(figsize=figsize, **kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+# ----------------------------------------------------------------------
+# Pool de figuras reaproveitáveis
+# ----------------------------------------------------------------------
+# Figuras livres por figsize. Criar a Figure com seu canvas Agg custa mais
+# que o desenho destes gráficos simples; uma figura devolvida ao pool é
+# limpa (``fig.clear``) e reaproveitada pela próxima chamada, que cria
+# apenas os eixos. Cada thread retira a sua figura.
+_FIG_POOL: Dict[Tuple[Tuple[float, float], Optional[str]], List[Figure]] = {}
+_FIG_POOL_LOCK = threading.Lock()
+_SUBPLOT_PARAMS = ('left', 'right', 'bottom', 'top', 'wspace', 'hspace')
+
+# Margens fixas de cada gráfico (frações da figura), medidas com o
+# tight_layout nos layouts destes gráficos, em vez de recalculá-las a cada
+# desenho. Rótulos que excederem as margens (ex.: nomes longos de
+# materiais) são incluídos pelo ``bbox_inches='tight'`` do savefig.
+_KPI_MARGINS = dict(left=0.02, right=0.98, top=0.93, bottom=0.02)
+_TOP_MATERIALS_MARGINS = dict(left=0.25, right=0.97, top=0.92, bottom=0.08)
+_EVOLUTION_MARGINS = dict(left=0.1, right=0.98, top=0.93, bottom=0.12)
+
+@contextmanager
+def _pooled_figure(
+    figsize: Tuple[float, float], nrows: int = 1, ncols: int = 1, layout: Optional[str] = None
+) -> Iterator[Tuple[Figure, Any]]:
+    """
+    Empresta uma figura Agg (fora do pyplot) com eixos novos, como
+    ``fig.subplots``. Com ``nrows=0`` a figura vem sem eixos (para quem monta
+    o próprio gridspec ou subfiguras). ``layout`` é o layout engine da figura
+    (ex.: "constrained") e faz parte da chave do pool.
+    """
+    key = (tuple(figsize), layout)
+    with _FIG_POOL_LOCK:
+        free = _FIG_POOL.setdefault(key, [])
+        fig = free.pop() if free else None
+    if fig is None:
+        fig = _new_figure(figsize, layout=layout)
+
+    yield fig, (fig.subplots(nrows, ncols) if nrows else None)
+
+    # Só volta ao pool se o desenho terminou sem erro (estado conhecido).
+    # Desfaz também as margens do gráfico: o próximo uso parte das padrão.
+    fig.clear()
+    if layout is None:
+        fig.subplots_adjust(**{k: plt.rcParams[f'figure.subplot.{k}'] for k in _SUBPLOT_PARAMS})
+    with _FIG_POOL_LOCK:
+        free.append(fig)
+
+def _savefig_bytes(fig: Figure, dpi: Optional[int] = None, fmt: Optional[str] = None) -> io.BytesIO:
+    """
+    Salva ``fig`` num BytesIO novo, já posicionado no início.
+    ``dpi`` e ``fmt`` ausentes usam ``CHART_DPI`` e ``CHART_FORMAT``.
+    """
+    fmt = (fmt or CHART_FORMAT).lower()
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, dpi=dpi or CHART_DPI, bbox_inches='tight', **_SAVE_KW.get(fmt, {}))
+    buf.seek(0)
+    return buf
+
+# ----------------------------------------------------------------------
+# Cache dos gráficos gerados
+# ----------------------------------------------------------------------
+# Os gráficos dependem apenas dos dados de entrada: os mesmos dados geram a
+# mesma imagem. Guarda os bytes das imagens (LRU) por um hash do conteúdo,
+# evitando redesenhar a cada rerun da app ou exportação de PDF. O limite é
+# pelo total de bytes guardados, já que cada imagem pode ter centenas de KB.
+CHART_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_chart_cache: "OrderedDict[bytes, bytes]" = OrderedDict()
+_chart_cache_bytes = 0
+_chart_cache_lock = threading.Lock()
+
+def _chart_cache_put(key: bytes, data: bytes) -> None:
+    """Guarda ``data`` no cache, descartando os mais antigos acima do limite."""
+    global _chart_cache_bytes
+    if len(data) > CHART_CACHE_MAX_BYTES:
+        return
+    with _chart_cache_lock:
+        antigo = _chart_cache.pop(key, None)
+        if antigo is not None:
+            _chart_cache_bytes -= len(antigo)
+        _chart_cache[key] = data
+        _chart_cache_bytes += len(data)
+        while _chart_cache_bytes > CHART_CACHE_MAX_BYTES:
+            _, descartado = _chart_cache.popitem(last=False)
+            _chart_cache_bytes -= len(descartado)
+
+def _memoize_chart(key_fn: Optional[Callable[..., Any]] = None, default_fmt: Optional[str] = None):
+    """
+    Decorador para funções que retornam ``Optional[io.BytesIO]`` e aceitam
+    ``dpi`` e ``fmt``. ``key_fn`` extrai dos argumentos apenas o que influencia
+    o desenho (padrão: todos os argumentos); dpi e formato efetivos entram
+    sempre na chave. ``default_fmt`` é o formato do gráfico quando o chamador
+    não informa um (padrão: ``CHART_FORMAT``). Falhas (``None``) não são
+    guardadas.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, dpi: Optional[int] = None, fmt: Optional[str] = None, **kwargs):
+            dpi = dpi or CHART_DPI
+            fmt = (fmt or default_fmt or CHART_FORMAT).lower()
+            payload = key_fn(*args, **kwargs) if key_fn else (args, kwargs)
+            raw = json.dumps([fn.__name__, dpi, fmt, payload], sort_keys=True, default=str)
+            key = blake2b(raw.encode("utf-8"), digest_size=16).digest()
+            with _chart_cache_lock:
+                cached = _chart_cache.get(key)
+                if cached is not None:
+                    _chart_cache.move_to_end(key)
+                    return io.BytesIO(cached)
+
+            buf = fn(*args, dpi=dpi, fmt=fmt, **kwargs)
+            if buf is not None:
+                _chart_cache_put(key, buf.getvalue())
+            return buf
+        return wrapper
+    return decorator
 
 # Alias local para manter o nome curto existente no código
 def format_currency(value: float) -> str:
     return format_currency_compact(value)
 
+def format_currency_array(values: Any) -> List[str]:
+    """Rótulos compactos (R$ 1.2K / R$ 3.4M) de vários valores de uma vez."""
+    return format_currency_compact_array(values)
+
+# Formatador único dos eixos monetários, instalado em todos os gráficos (o
+# FuncFormatter não consulta o eixo ao formatar, então a instância pode ser
+# compartilhada). Os ticks se repetem entre gráficos e gerências (R$ 0,
+# R$ 500.0K, R$ 1.0M...), então os rótulos ficam em cache.
+@lru_cache(maxsize=1024)
+def _currency_tick_label(value: float) -> str:
+    return format_currency(value)
+
+def _currency_tick(value: float, pos: Optional[int] = None) -> str:
+    return _currency_tick_label(value)
+
+_CURRENCY_FORMATTER = FuncFormatter(_currency_tick)
+
+# Cores das barras/fatias: amostras de um colormap que dependem só do nome,
+# do intervalo e da quantidade (no máximo 10 materiais), então são calculadas
+# uma vez. O array devolvido é compartilhado e por isso somente leitura.
+@lru_cache(maxsize=32)
+def _cmap_colors(name: str, start: float, stop: float, n: int) -> np.ndarray:
+    cores = plt.colormaps[name](np.linspace(start, stop, n))
+    cores.setflags(write=False)
+    return cores
+
 # ----------------------------------------------------------------------
 # Gráfico: KPI Cards
 # ----------------------------------------------------------------------
-def create_kpi_cards_chart(kpis: Dict[str, Any], gerencia: str) -> Optional[io.BytesIO]:
+# Geometria fixa dos cards de KPI, calculada uma vez: canto inferior esquerdo
+# de cada card no eixo 2x2 (linha de cima, depois a de baixo) e centros dos
+# quatro cards em linha do dashboard
+_KPI_CARD_ORIGINS = ((0, 1), (1, 1), (0, 0), (1, 0))
+_DASHBOARD_KPI_X = tuple(i * 0.25 + 0.125 for i in range(4))
+
+def kpi_card_specs(kpis: Dict[str, Any]) -> List[Tuple[str, str, str, str]]:
+    """
+    Conteúdo dos quatro cards de KPI como (título, valor, cor, fundo), na
+    ordem dos cards: linha de cima, depois a de baixo. Compartilhado entre o
+    gráfico e os cards desenhados direto no PDF.
+    """
+    variacao = float(kpis.get('variacao_mensal', 0) or 0)
+    cor_variacao = '#d62728' if variacao > 0 else '#2ca02c'
+    sinal = '+' if variacao > 0 else ''
+    return [
+        ('Valor Total', format_currency(kpis.get('valor_total', 0)), '#1f77b4', '#e6f3ff'),
+        ('Materiais', safe_format_number(kpis.get('numero_materiais', 0)), '#ff7f0e', '#fff2e6'),
+        ('Quantidade', safe_format_number(kpis.get('quantidade_total', 0)), '#2ca02c', '#e6ffe6'),
+        ('Variação Mensal', f"{sinal}{variacao:.1f}%", cor_variacao,
+         '#ffe6e6' if variacao > 0 else '#e6ffe6'),
+    ]
+
+def _draw_kpi_cards(ax: Any, kpis: Dict[str, Any]) -> None:
+    """
+    Desenha os quatro cards de KPI num único eixo 2x2 em coordenadas de
+    dados, com as molduras numa só coleção, em vez de quatro eixos completos
+    (spines, ticks, layout).
+    """
+    cards = kpi_card_specs(kpis)
+    ax.set_xlim(0, 2); ax.set_ylim(0, 2); ax.axis('off')
+    ax.add_collection(PatchCollection(
+        [Rectangle((x + 0.05, y + 0.05), 0.9, 0.9) for x, y in _KPI_CARD_ORIGINS],
+        facecolors=[c[3] for c in cards], edgecolors=[c[2] for c in cards],
+        linewidths=2, alpha=0.3,
+    ))
+    for (x, y), (titulo, valor, cor, _) in zip(_KPI_CARD_ORIGINS, cards):
+        ax.text(x + 0.5, y + 0.7, titulo, ha='center', va='center', fontsize=14, fontweight='bold')
+        ax.text(x + 0.5, y + 0.3, valor, ha='center', va='center', fontsize=20, color=cor, fontweight='bold')
+
+@_memoize_chart()
+def create_kpi_cards_chart(
+    kpis: Dict[str, Any], gerencia: str, dpi: Optional[int] = None, fmt: Optional[str] = None
+) -> Optional[io.BytesIO]:
     """Cria cards com KPIs principais."""
     try:
-        setup_plot_style()
-
-        fig, axes = plt.subplots(2, 2, figsize=(12, 8))
-        fig.suptitle(f'KPIs Principais - {gerencia}', fontsize=16, fontweight='bold')
-
-        # 1) Valor Total
-        ax1 = axes[0, 0]
-        ax1.text(0.5, 0.7, 'Valor Total', ha='center', va='center', fontsize=14, fontweight='bold')
-        ax1.text(0.5, 0.3, format_currency(kpis.get('valor_total', 0)),
-                 ha='center', va='center', fontsize=20, color='#1f77b4', fontweight='bold')
-        ax1.set_xlim(0, 1); ax1.set_ylim(0, 1); ax1.axis('off')
-        ax1.add_patch(Rectangle((0.05, 0.05), 0.9, 0.9, linewidth=2,
-                                edgecolor='#1f77b4', facecolor='#e6f3ff', alpha=0.3))
-
-        # 2) Materiais
-        ax2 = axes[0, 1]
-        ax2.text(0.5, 0.7, 'Materiais', ha='center', va='center', fontsize=14, fontweight='bold')
-        ax2.text(0.5, 0.3, safe_format_number(kpis.get('numero_materiais', 0)),
-                 ha='center', va='center', fontsize=20, color='#ff7f0e', fontweight='bold')
-        ax2.set_xlim(0, 1); ax2.set_ylim(0, 1); ax2.axis('off')
-        ax2.add_patch(Rectangle((0.05, 0.05), 0.9, 0.9, linewidth=2,
-                                edgecolor='#ff7f0e', facecolor='#fff2e6', alpha=0.3))
-
-        # 3) Quantidade
-        ax3 = axes[1, 0]
-        ax3.text(0.5, 0.7, 'Quantidade', ha='center', va='center', fontsize=14, fontweight='bold')
-        ax3.text(0.5, 0.3, safe_format_number(kpis.get('quantidade_total', 0)),
-                 ha='center', va='center', fontsize=20, color='#2ca02c', fontweight='bold')
-        ax3.set_xlim(0, 1); ax3.set_ylim(0, 1); ax3.axis('off')
-        ax3.add_patch(Rectangle((0.05, 0.05), 0.9, 0.9, linewidth=2,
-                                edgecolor='#2ca02c', facecolor='#e6ffe6', alpha=0.3))
-
-        # 4) Variação Mensal
-        ax4 = axes[1, 1]
-        variacao = float(kpis.get('variacao_mensal', 0) or 0)
-        cor_variacao = '#d62728' if variacao > 0 else '#2ca02c'
-        sinal = '+' if variacao > 0 else ''
-        ax4.text(0.5, 0.7, 'Variação Mensal', ha='center', va='center', fontsize=14, fontweight='bold')
-        ax4.text(0.5, 0.3, f"{sinal}{variacao:.1f}%",
-                 ha='center', va='center', fontsize=20, color=cor_variacao, fontweight='bold')
-        ax4.set_xlim(0, 1); ax4.set_ylim(0, 1); ax4.axis('off')
-        ax4.add_patch(Rectangle((0.05, 0.05), 0.9, 0.9, linewidth=2,
-                                edgecolor=cor_variacao, facecolor=('#ffe6e6' if variacao > 0 else '#e6ffe6'), alpha=0.3))
-
-        plt.tight_layout()
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=300, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        return buf
-    except Exception as e:
+        # Figura fora do pyplot: pode ser desenhada em paralelo (ver
+        # ``generate_all_charts_for_gerencia``)
+        with _pooled_figure((12, 8)) as (fig, ax):
+            fig.suptitle(f'KPIs Principais - {gerencia}', fontsize=16, fontweight='bold')
+            _draw_kpi_cards(ax, kpis)
+            fig.subplots_adjust(**_KPI_MARGINS)
+            return _savefig_bytes(fig, dpi, fmt)
+    except (TypeError, ValueError) as e:
         print(f"Erro ao criar gráfico de KPIs: {e}")
-        plt.close('all')
         return None
 
 # ----------------------------------------------------------------------
 # Gráfico: Top Materiais
 # ----------------------------------------------------------------------
-def create_top_materials_chart(top_materiais: List[Tuple[str, float]], gerencia: str) -> Optional[io.BytesIO]:
+def _draw_top_materials(ax: Any, top_materiais: List[Tuple[str, float]], gerencia: str) -> None:
+    """Desenha as barras dos 10 maiores materiais por valor em ``ax``."""
+    items = top_materiais[:10]
+    materiais = [m for m, _ in items]
+    valores = np.fromiter((float(v) for _, v in items), dtype=np.float64, count=len(items))
+
+    colors = _cmap_colors('Blues', 0.4, 0.8, len(materiais))
+    bars = ax.barh(materiais, valores, color=colors)
+
+    ax.bar_label(bars, labels=format_currency_array(valores), padding=3, fontweight='bold')
+
+    ax.set_xlabel('Valor (R$)', fontsize=12, fontweight='bold')
+    ax.set_ylabel('Material',   fontsize=12, fontweight='bold')
+    ax.set_title(f'Top {len(materiais)} Materiais por Valor - {gerencia}', fontsize=14, fontweight='bold', pad=20)
+    ax.xaxis.set_major_formatter(_CURRENCY_FORMATTER)
+    ax.invert_yaxis()
+
+@_memoize_chart()
+def create_top_materials_chart(
+    top_materiais: List[Tuple[str, float]], gerencia: str, dpi: Optional[int] = None, fmt: Optional[str] = None
+) -> Optional[io.BytesIO]:
     """Cria gráfico de barras dos Top Materiais por valor."""
     try:
-        setup_plot_style()
-
         if not top_materiais:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            ax.text(0.5, 0.5, 'Nenhum material encontrado', ha='center', va='center', fontsize=16)
-            ax.set_xlim(0, 1); ax.set_ylim(0, 1); ax.axis('off')
-            plt.title(f'Top Materiais por Valor - {gerencia}')
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=300, bbox_inches='tight')
-            buf.seek(0); plt.close(fig)
+            with _pooled_figure((10, 6)) as (fig, ax):
+                ax.text(0.5, 0.5, 'Nenhum material encontrado', ha='center', va='center', fontsize=16)
+                ax.set_xlim(0, 1); ax.set_ylim(0, 1); ax.axis('off')
+                ax.set_title(f'Top Materiais por Valor - {gerencia}')
+                buf = _savefig_bytes(fig, dpi, fmt)
             return buf
 
-        items = top_materiais[:10]
-        materiais = [m for m, _ in items]
-        valores = [float(v) for _, v in items]
-
-        fig, ax = plt.subplots(figsize=(12, 8))
-        colors = plt.cm.Blues(np.linspace(0.4, 0.8, len(materiais)))
-        bars = ax.barh(materiais, valores, color=colors)
-
-        for bar, valor in zip(bars, valores):
-            width = bar.get_width()
-            ax.text(width + max(valores)*0.01, bar.get_y()+bar.get_height()/2,
-                    format_currency(valor), ha='left', va='center', fontweight='bold')
-
-        ax.set_xlabel('Valor (R$)', fontsize=12, fontweight='bold')
-        ax.set_ylabel('Material',   fontsize=12, fontweight='bold')
-        ax.set_title(f'Top {len(materiais)} Materiais por Valor - {gerencia}', fontsize=14, fontweight='bold', pad=20)
-        ax.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x)))
-        ax.invert_yaxis()
-
-        plt.tight_layout()
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=300, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        return buf
-    except Exception as e:
+        with _pooled_figure((12, 8)) as (fig, ax):
+            _draw_top_materials(ax, top_materiais, gerencia)
+            fig.subplots_adjust(**_TOP_MATERIALS_MARGINS)
+            return _savefig_bytes(fig, dpi, fmt)
+    except (TypeError, ValueError) as e:
         print(f"Erro ao criar gráfico de Top Materiais: {e}")
-        plt.close('all')
         return None
 
 # ----------------------------------------------------------------------
 # Gráfico: Evolução Mensal (corrigido com eixo numérico)
 # ----------------------------------------------------------------------
-def create_monthly_evolution_chart(evolucao: List[Dict[str, Any]], gerencia: str) -> Optional[io.BytesIO]:
+def _style_evolution_axes(ax: Any) -> None:
+    """Partes do gráfico de evolução que não dependem dos dados."""
+    ax.set_xlabel('Período')
+    ax.set_ylabel('Valor do Estoque Excedente')
+    ax.yaxis.set_major_formatter(_CURRENCY_FORMATTER)
+    ax.grid(True, alpha=0.3)
+
+def _evolution_label_transform(ax: Any) -> Any:
+    """Transform de dados deslocado 8 pt para cima, para os rótulos dos pontos."""
+    return ax.transData + ScaledTranslation(0, 8 / 72, ax.figure.dpi_scale_trans)
+
+def _evolution_data_artists(ax: Any, x: np.ndarray, valores: np.ndarray, color: Any, label_transform: Any) -> List[Any]:
+    """Área sob a linha e rótulos dos pontos; devolve os artistas criados."""
+    artists = [ax.fill_between(x, valores, alpha=0.25, facecolor=color)]
+    # Rótulos dos pontos: textos simples com um único transform
+    # deslocado (8 pt acima do ponto), em vez de um annotate por ponto, e
+    # sem caixa de fundo (cada caixa é um patch a mais, com seu próprio
+    # cálculo de geometria no desenho)
+    artists.extend(
+        ax.text(i, val, label, transform=label_transform, ha='center', fontweight='bold')
+        for i, (val, label) in enumerate(zip(valores, format_currency_array(valores)))
+    )
+    return artists
+
+def _finish_evolution_axes(ax: Any, x: np.ndarray, meses: List[str], gerencia: str) -> None:
+    """Escala, título e ticks do eixo X a partir dos dados já desenhados."""
+    # relim() ignora a área preenchida; inclui a base (y=0) explicitamente
+    ax.relim()
+    ax.update_datalim(np.column_stack([x, np.zeros(len(x))]))
+    ax.autoscale_view()
+
+    ax.set_title(f'Evolução Mensal - {gerencia}')
+    ax.set_xticks(x)
+    ax.set_xticklabels(meses, rotation=45 if len(meses) > 6 else 0)
+
+def _draw_evolution(ax: Any, meses: List[str], valores: np.ndarray, gerencia: str) -> None:
+    """Desenha a evolução mensal num eixo novo (versão sem template)."""
+    _style_evolution_axes(ax)
+    x = np.arange(len(meses))
+    (line,) = ax.plot(x, valores, marker='o', linewidth=2.5, markersize=6)
+    _evolution_data_artists(ax, x, valores, line.get_color(), _evolution_label_transform(ax))
+    _finish_evolution_axes(ax, x, meses, gerencia)
+
+class _LineChartTemplate:
+    """
+    Figura de evolução mensal montada uma única vez e reaproveitada.
+
+    Eixos, rótulos, grade e formatador são configurados na criação; a cada
+    gráfico apenas os artistas que dependem dos dados (linha, área, rótulos
+    dos pontos, título e ticks do eixo X) são atualizados antes de salvar.
+    O fundo não é reaproveitado via blitting porque a escala do eixo Y muda
+    com os valores de cada gerência. A figura não pertence ao pyplot e é
+    protegida por um lock, pois a app atende várias sessões em threads.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.fig = _new_figure((12, 6))
+        self.ax = self.fig.add_subplot()
+        (self.line,) = self.ax.plot([], [], marker='o', linewidth=2.5, markersize=6)
+        _style_evolution_axes(self.ax)
+        self.fig.subplots_adjust(**_EVOLUTION_MARGINS)
+        self.label_transform = _evolution_label_transform(self.ax)
+        self._dynamic: List[Any] = []
+
+    def render(
+        self, meses: List[str], valores: np.ndarray, gerencia: str,
+        dpi: Optional[int] = None, fmt: Optional[str] = None,
+    ) -> io.BytesIO:
+        with self.lock:
+            ax = self.ax
+            for artist in self._dynamic:
+                artist.remove()
+
+            x = np.arange(len(meses))  # X numérico evita erro do fill_between
+            self.line.set_data(x, valores)
+            self._dynamic = _evolution_data_artists(ax, x, valores, self.line.get_color(), self.label_transform)
+            _finish_evolution_axes(ax, x, meses, gerencia)
+
+            return _savefig_bytes(self.fig, dpi, fmt)
+
+
+_line_chart_template: Optional[_LineChartTemplate] = None
+
+
+def _monthly_series(evolucao: List[Dict[str, Any]]) -> Tuple[List[str], np.ndarray]:
+    """Separa a evolução mensal em rótulos dos meses e array de valores."""
+    meses = [str(item.get("mes", "")) for item in evolucao]
+    valores = np.fromiter((float(item.get("valor", item.get("valor_total", 0.0))) for item in evolucao),
+                          dtype=np.float64, count=len(evolucao))
+    return meses, valores
+
+@_memoize_chart(default_fmt=FILLED_CHART_FORMAT)
+def create_monthly_evolution_chart(
+    evolucao: List[Dict[str, Any]], gerencia: str, dpi: Optional[int] = None, fmt: Optional[str] = None
+) -> Optional[io.BytesIO]:
     """
     Gera o gráfico de evolução mensal. Espera lista de dicts:
     [{"mes":"01","valor":12345.0}, ...]
     """
+    global _line_chart_template
+    if not evolucao:
+        return None
     try:
-        setup_plot_style()
-        if not evolucao:
-            return None
-
-        meses   = [str(item.get("mes", "")) for item in evolucao]
-        valores = [float(item.get("valor", item.get("valor_total", 0.0))) for item in evolucao]
-
-        x = np.arange(len(meses))  # X numérico evita erro do fill_between
-        fig, ax = plt.subplots(figsize=(12, 6))
-
-        ax.plot(x, valores, marker='o', linewidth=2.5, markersize=6)
-        ax.fill_between(x, valores, alpha=0.25)
-
-        for i, (mes, val) in enumerate(zip(meses, valores)):
-            ax.annotate(format_currency(val), (i, val), textcoords="offset points",
-                        xytext=(0, 8), ha='center', fontweight='bold',
-                        bbox=dict(boxstyle="round,pad=0.2", facecolor='white', alpha=0.8))
-
-        ax.set_xlabel('Período')
-        ax.set_ylabel('Valor do Estoque Excedente')
-        ax.set_title(f'Evolução Mensal - {gerencia}')
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda v, p: format_currency(v)))
-
-        ax.set_xticks(x)
-        ax.set_xticklabels(meses, rotation=45 if len(meses) > 6 else 0)
-        ax.grid(True, alpha=0.3)
-        plt.tight_layout()
+        meses, valores = _monthly_series(evolucao)
+    except (TypeError, ValueError) as e:
+        print(f"Erro ao criar gráfico de evolução mensal: {e}")
+        return None
 
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=150, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        return buf
+    if _line_chart_template is None:
+        _line_chart_template = _LineChartTemplate()
+    try:
+        return _line_chart_template.render(meses, valores, gerencia, dpi, fmt)
     except Exception as e:
-        print(f"Erro ao criar gráfico de evolução mensal: {e}")
-        plt.close('all')
+        _line_chart_template = None  # estado da figura incerto: recria na próxima chamada
+        if isinstance(e, (TypeError, ValueError)):
+            print(f"Erro ao criar gráfico de evolução mensal: {e}")
+            return None
+        raise
+
+def create_monthly_evolution_chart_plotly(evolucao: List[Dict[str, Any]], gerencia: str) -> Optional[str]:
+    """
+    Versão interativa da evolução mensal para o navegador: devolve a figura
+    Plotly serializada em JSON (sem rasterizar). Retorna None sem dados ou
+    sem o pacote plotly instalado.
+    """
+    if not PLOTLY_AVAILABLE or not evolucao:
+        return None
+    try:
+        meses, valores = _monthly_series(evolucao)
+        fig = go.Figure(go.Scatter(
+            x=meses, y=valores, mode='lines+markers+text', fill='tozeroy',
+            text=format_currency_array(valores), textposition='top center',
+            line=dict(width=2.5), marker=dict(size=6),
+        ))
+        fig.update_layout(
+            title=f'Evolução Mensal - {gerencia}',
+            xaxis_title='Período', yaxis_title='Valor do Estoque Excedente',
+            template='plotly_white', margin=dict(l=40, r=20, t=60, b=40),
+        )
+        fig.update_xaxes(type='category')
+        return fig.to_json()
+    except (TypeError, ValueError) as e:
+        print(f"Erro ao criar gráfico interativo de evolução mensal: {e}")
         return None
 
 # ----------------------------------------------------------------------
 # Dashboard resumo (opcional; usado na app)
 # ----------------------------------------------------------------------
-def create_summary_dashboard(analysis_data: Dict[str, Any]) -> Optional[io.BytesIO]:
+@_memoize_chart(lambda analysis_data: {
+    k: analysis_data.get(k) for k in ('gerencia', 'kpis', 'top_materiais', 'evolucao_mensal', 'evolucao_temporal')
+}, default_fmt=FILLED_CHART_FORMAT)
+def create_summary_dashboard(
+    analysis_data: Dict[str, Any], dpi: Optional[int] = None, fmt: Optional[str] = None
+) -> Optional[io.BytesIO]:
     """
     Cria um painel resumo em uma única imagem.
     Espera chaves: 'gerencia', 'kpis', 'top_materiais', 'evolucao_mensal'
     """
     try:
-        setup_plot_style()
 
         gerencia = analysis_data.get('gerencia', 'N/A')
         kpis = analysis_data.get('kpis', {})
         top_materiais = analysis_data.get('top_materiais', [])
         evolucao = analysis_data.get('evolucao_mensal', []) or analysis_data.get('evolucao_temporal', [])
 
-        fig = plt.figure(figsize=(16, 12))
-        gs = fig.add_gridspec(3, 2, height_ratios=[1, 1.5, 1.5], hspace=0.3, wspace=0.3)
-        fig.suptitle(f'Dashboard Completo - {gerencia}', fontsize=20, fontweight='bold', y=0.95)
-
-        # 1) KPIs
-        ax_kpis = fig.add_subplot(gs[0, :])
-        kpi_names = ['Valor Total', 'Materiais', 'Quantidade', 'Variação %']
-        kpi_values = [
-            format_currency(kpis.get('valor_total', 0)),
-            safe_format_number(kpis.get('numero_materiais', 0)),
-            safe_format_number(kpis.get('quantidade_total', 0)),
-            f"{float(kpis.get('variacao_mensal', 0) or 0):+.1f}%"
-        ]
-        kpi_colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728' if float(kpis.get('variacao_mensal', 0) or 0) > 0 else '#2ca02c']
-        for i, (name, value, color) in enumerate(zip(kpi_names, kpi_values, kpi_colors)):
-            x_pos = i * 0.25 + 0.125
-            rect = Rectangle((x_pos - 0.1, 0.2), 0.2, 0.6, linewidth=2, edgecolor=color, facecolor=color, alpha=0.1)
-            ax_kpis.add_patch(rect)
-            ax_kpis.text(x_pos, 0.7, name,  ha='center', va='center', fontsize=10, fontweight='bold')
-            ax_kpis.text(x_pos, 0.4, value, ha='center', va='center', fontsize=14, fontweight='bold', color=color)
-        ax_kpis.set_xlim(0, 1); ax_kpis.set_ylim(0, 1); ax_kpis.axis('off')
-
-        # 2) Top Materiais
-        ax_materials = fig.add_subplot(gs[1, 0])
-        if top_materiais:
-            items = top_materiais[:8]
-            materiais = [m for m, _ in items]
-            valores = [float(v) for _, v in items]
-            colors = plt.cm.Set3(np.linspace(0, 1, len(materiais)))
-            bars = ax_materials.barh(materiais, valores, color=colors)
-            for bar, valor in zip(bars, valores):
-                width = bar.get_width()
-                ax_materials.text(width + max(valores) * 0.02, bar.get_y() + bar.get_height()/2,
-                                  format_currency(valor), ha='left', va='center', fontsize=9)
-            ax_materials.set_xlabel('Valor (R$)', fontsize=10)
-            ax_materials.set_title('Top Materiais por Valor', fontsize=12, fontweight='bold')
-            ax_materials.invert_yaxis()
-            ax_materials.xaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x)))
-        else:
-            ax_materials.text(0.5, 0.5, 'Dados não disponíveis', ha='center', va='center')
-            ax_materials.set_xlim(0, 1); ax_materials.set_ylim(0, 1); ax_materials.axis('off')
-
-        # 3) Evolução Mensal
-        ax_evolution = fig.add_subplot(gs[1, 1])
-        if evolucao and len(evolucao) > 1:
-            meses = [str(item.get('mes', '')) for item in evolucao]
-            valores = [float(item.get('valor', item.get('valor_total', 0.0))) for item in evolucao]
-            x = np.arange(len(meses))
-            ax_evolution.plot(x, valores, marker='o', linewidth=2, markersize=6, color='#1f77b4')
-            ax_evolution.fill_between(x, valores, alpha=0.3, color='#1f77b4')
-            ax_evolution.set_xlabel('Período', fontsize=10)
-            ax_evolution.set_ylabel('Valor (R$)', fontsize=10)
-            ax_evolution.set_title('Evolução Mensal', fontsize=12, fontweight='bold')
-            ax_evolution.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: format_currency(x)))
-            ax_evolution.set_xticks(x); ax_evolution.set_xticklabels(meses, rotation=45 if len(meses) > 6 else 0)
-            ax_evolution.grid(True, alpha=0.3)
-        else:
-            ax_evolution.text(0.5, 0.5, 'Dados insuficientes\npara evolução mensal', ha='center', va='center', fontsize=12)
-            ax_evolution.set_xlim(0, 1); ax_evolution.set_ylim(0, 1); ax_evolution.axis('off')
-
-        # 4) Pizza de distribuição (opcional)
-        ax_dist = fig.add_subplot(gs[2, :])
-        if top_materiais:
-            items = top_materiais[:6]
-            materiais_pie = [m for m, _ in items]
-            valores_pie = [float(v) for _, v in items]
-            if len(top_materiais) > 6:
-                outros = sum(float(v) for _, v in top_materiais[6:])
-                materiais_pie.append('Outros'); valores_pie.append(outros)
-            colors = plt.cm.Set3(np.linspace(0, 1, len(materiais_pie)))
-            wedges, texts, autotexts = ax_dist.pie(
-                valores_pie,
-                labels=materiais_pie,
-                autopct=lambda pct: format_currency(sum(valores_pie)*pct/100),
-                colors=colors,
-                startangle=90
-            )
-            for autotext in autotexts:
-                autotext.set_color('white'); autotext.set_fontweight('bold'); autotext.set_fontsize(9)
-            ax_dist.set_title('Distribuição de Valor por Material', fontsize=12, fontweight='bold')
-        else:
-            ax_dist.text(0.5, 0.5, 'Dados não disponíveis para distribuição', ha='center', va='center', fontsize=12)
-            ax_dist.axis('off')
-
-        plt.tight_layout()
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=300, bbox_inches='tight')
-        buf.seek(0)
-        plt.close(fig)
-        return buf
-
-    except Exception as e:
+        with _pooled_figure((16, 12), 0) as (fig, _):
+            gs = fig.add_gridspec(3, 2, height_ratios=[1, 1.5, 1.5], hspace=0.3, wspace=0.3)
+            fig.suptitle(f'Dashboard Completo - {gerencia}', fontsize=20, fontweight='bold', y=0.95)
+
+            # 1) KPIs
+            ax_kpis = fig.add_subplot(gs[0, :])
+            kpi_names = ['Valor Total', 'Materiais', 'Quantidade', 'Variação %']
+            kpi_values = [
+                format_currency(kpis.get('valor_total', 0)),
+                safe_format_number(kpis.get('numero_materiais', 0)),
+                safe_format_number(kpis.get('quantidade_total', 0)),
+                f"{float(kpis.get('variacao_mensal', 0) or 0):+.1f}%"
+            ]
+            kpi_colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728' if float(kpis.get('variacao_mensal', 0) or 0) > 0 else '#2ca02c']
+            ax_kpis.add_collection(PatchCollection(
+                [Rectangle((x_pos - 0.1, 0.2), 0.2, 0.6) for x_pos in _DASHBOARD_KPI_X],
+                facecolors=kpi_colors, edgecolors=kpi_colors, linewidths=2, alpha=0.1,
+            ))
+            for x_pos, name, value, color in zip(_DASHBOARD_KPI_X, kpi_names, kpi_values, kpi_colors):
+                ax_kpis.text(x_pos, 0.7, name,  ha='center', va='center', fontsize=10, fontweight='bold')
+                ax_kpis.text(x_pos, 0.4, value, ha='center', va='center', fontsize=14, fontweight='bold', color=color)
+            ax_kpis.set_xlim(0, 1); ax_kpis.set_ylim(0, 1); ax_kpis.axis('off')
+
+            # 2) Top Materiais
+            ax_materials = fig.add_subplot(gs[1, 0])
+            if top_materiais:
+                items = top_materiais[:8]
+                materiais = [m for m, _ in items]
+                valores = np.fromiter((float(v) for _, v in items), dtype=np.float64, count=len(items))
+                colors = _cmap_colors('Set3', 0.0, 1.0, len(materiais))
+                bars = ax_materials.barh(materiais, valores, color=colors)
+                ax_materials.bar_label(bars, labels=format_currency_array(valores), padding=3, fontsize=9)
+                ax_materials.set_xlabel('Valor (R$)', fontsize=10)
+                ax_materials.set_title('Top Materiais por Valor', fontsize=12, fontweight='bold')
+                ax_materials.invert_yaxis()
+                ax_materials.xaxis.set_major_formatter(_CURRENCY_FORMATTER)
+            else:
+                ax_materials.text(0.5, 0.5, 'Dados não disponíveis', ha='center', va='center')
+                ax_materials.set_xlim(0, 1); ax_materials.set_ylim(0, 1); ax_materials.axis('off')
+
+            # 3) Evolução Mensal
+            ax_evolution = fig.add_subplot(gs[1, 1])
+            if evolucao and len(evolucao) > 1:
+                meses, valores = _monthly_series(evolucao)
+                x = np.arange(len(meses))
+                ax_evolution.plot(x, valores, marker='o', linewidth=2, markersize=6, color='#1f77b4')
+                ax_evolution.fill_between(x, valores, alpha=0.3, color='#1f77b4')
+                ax_evolution.set_xlabel('Período', fontsize=10)
+                ax_evolution.set_ylabel('Valor (R$)', fontsize=10)
+                ax_evolution.set_title('Evolução Mensal', fontsize=12, fontweight='bold')
+                ax_evolution.yaxis.set_major_formatter(_CURRENCY_FORMATTER)
+                ax_evolution.set_xticks(x); ax_evolution.set_xticklabels(meses, rotation=45 if len(meses) > 6 else 0)
+                ax_evolution.grid(True, alpha=0.3)
+            else:
+                ax_evolution.text(0.5, 0.5, 'Dados insuficientes\npara evolução mensal', ha='center', va='center', fontsize=12)
+                ax_evolution.set_xlim(0, 1); ax_evolution.set_ylim(0, 1); ax_evolution.axis('off')
+
+            # 4) Pizza de distribuição (opcional)
+            ax_dist = fig.add_subplot(gs[2, :])
+            if top_materiais:
+                # Seis maiores + "Outros" (soma do restante) num único array
+                todos = np.fromiter((float(v) for _, v in top_materiais), dtype=np.float64, count=len(top_materiais))
+                materiais_pie = [m for m, _ in top_materiais[:6]]
+                valores_pie = todos[:6]
+                if len(todos) > 6:
+                    materiais_pie.append('Outros')
+                    valores_pie = np.append(valores_pie, todos[6:].sum())
+                # Rótulos de valor formatados de uma vez; o pie chama autopct
+                # uma vez por fatia, na mesma ordem dos valores
+                rotulos_pie = iter(format_currency_array(valores_pie))
+                colors = _cmap_colors('Set3', 0.0, 1.0, len(materiais_pie))
+                wedges, texts, autotexts = ax_dist.pie(
+                    valores_pie,
+                    labels=materiais_pie,
+                    autopct=lambda pct: next(rotulos_pie),
+                    colors=colors,
+                    startangle=90
+                )
+                plt.setp(autotexts, color='white', fontweight='bold', fontsize=9)
+                ax_dist.set_title('Distribuição de Valor por Material', fontsize=12, fontweight='bold')
+            else:
+                ax_dist.text(0.5, 0.5, 'Dados não disponíveis para distribuição', ha='center', va='center', fontsize=12)
+                ax_dist.axis('off')
+
+            # Sem tight_layout: ele não se aplica a eixos de um gridspec
+            # próprio (só avisava e mantinha as margens); o espaçamento vem
+            # do hspace/wspace do gridspec
+            return _savefig_bytes(fig, dpi, fmt)
+
+    except (TypeError, ValueError) as e:
         print(f"Erro ao criar dashboard resumo: {e}")
-        plt.close('all')
+        return None
+
+# ----------------------------------------------------------------------
+# Painel combinado para o PDF
+# ----------------------------------------------------------------------
+# Altura (polegadas) de cada painel na figura combinada, com 12 de largura
+_COMBINED_PANEL_HEIGHTS = {'kpis': 5.0, 'evolucao_mensal': 6.0, 'top_materiais': 7.0}
+
+@_memoize_chart(lambda analysis_data, include_kpis=True: {
+    **{k: analysis_data.get(k) for k in ('gerencia', 'kpis', 'top_materiais', 'evolucao_mensal')},
+    'include_kpis': include_kpis,
+})
+def generate_combined_chart_for_gerencia(
+    analysis_data: Dict[str, Any],
+    include_kpis: bool = True,
+    dpi: Optional[int] = None,
+    fmt: Optional[str] = None,
+) -> Optional[io.BytesIO]:
+    """
+    Gera KPIs, evolução mensal e top materiais como painéis empilhados de
+    uma única figura: uma rasterização e uma compressão de imagem por
+    gerência no PDF, em vez de uma por gráfico. Sem evolução mensal o
+    painel é omitido; com ``include_kpis=False`` o painel de KPIs também
+    (o PDF desenha os cards como tabela).
+    """
+    try:
+        gerencia = analysis_data.get('gerencia', 'N/A')
+        kpis = analysis_data.get('kpis', {})
+        top_materiais = analysis_data.get('top_materiais', [])
+        evolucao = analysis_data.get('evolucao_mensal', [])
+
+        paineis = (
+            (['kpis'] if include_kpis else [])
+            + (['evolucao_mensal'] if evolucao else [])
+            + ['top_materiais']
+        )
+        alturas = [_COMBINED_PANEL_HEIGHTS[p] for p in paineis]
+        # Subfiguras com layout próprio: as margens que cada painel precisa
+        # (ex.: nomes longos de materiais) não deslocam os demais
+        with _pooled_figure((12, sum(alturas)), 0, layout='constrained') as (fig, _):
+            subfigs = fig.subfigures(len(paineis), 1, height_ratios=alturas, squeeze=False)[:, 0]
+
+            for subfig, painel in zip(subfigs, paineis):
+                ax = subfig.subplots()
+                if painel == 'kpis':
+                    ax.set_title(f'KPIs Principais - {gerencia}', fontsize=16, fontweight='bold')
+                    _draw_kpi_cards(ax, kpis)
+                elif painel == 'evolucao_mensal':
+                    meses, valores = _monthly_series(evolucao)
+                    _draw_evolution(ax, meses, valores, gerencia)
+                elif top_materiais:
+                    _draw_top_materials(ax, top_materiais, gerencia)
+                else:
+                    ax.text(0.5, 0.5, 'Nenhum material encontrado', ha='center', va='center', fontsize=16)
+                    ax.set_xlim(0, 1); ax.set_ylim(0, 1); ax.axis('off')
+                    ax.set_title(f'Top Materiais por Valor - {gerencia}')
+
+            return _savefig_bytes(fig, dpi, fmt)
+    except (TypeError, ValueError) as e:
+        print(f"Erro ao criar painel combinado: {e}")
         return None
 
 # ----------------------------------------------------------------------
 # Fábrica de gráficos por gerência (usada pelo PDF)
 # ----------------------------------------------------------------------
-def generate_all_charts_for_gerencia(analysis_data: Dict[str, Any]) -> Dict[str, io.BytesIO]:
+def _render_chart(
+    name: str, fn: Callable[..., Optional[io.BytesIO]], arg: Any, gerencia: str, dpi: Optional[int] = None
+) -> Optional[io.BytesIO]:
+    """
+    Executa um construtor de gráfico isolando falhas inesperadas de desenho:
+    um gráfico com erro fica de fora sem derrubar os demais nem o PDF.
+    """
+    try:
+        return fn(arg, gerencia, dpi=dpi)
+    except Exception as e:
+        print(f"Erro ao gerar o gráfico '{name}' de {gerencia}: {e}")
+        return None
+
+def generate_all_charts_for_gerencia(
+    analysis_data: Dict[str, Any],
+    max_workers: Optional[int] = None,
+    exclude: Tuple[str, ...] = (),
+    dpi: Optional[int] = None,
+) -> Dict[str, io.BytesIO]:
     """
     Gera todos os gráficos necessários para o PDF de uma gerência.
     Espera as chaves: 'gerencia', 'kpis', 'evolucao_mensal', 'top_materiais'
     Retorna: {'kpis': BytesIO, 'evolucao_mensal': BytesIO, 'top_materiais': BytesIO}
+
+    Os gráficos são independentes e cada um usa a sua própria figura Agg
+    (sem o estado global do pyplot), então são gerados em threads; boa parte
+    do tempo é rasterização e compressão PNG em C. ``max_workers`` limita as
+    threads (padrão: número de gráficos ou de núcleos, o que for menor).
+    ``exclude`` lista gráficos que não devem ser gerados (ex.: a evolução
+    mensal quando a app a exibe via Plotly). ``dpi`` ausente usa ``CHART_DPI``.
     """
-    charts: Dict[str, io.BytesIO] = {}
     gerencia = analysis_data.get('gerencia', 'N/A')
-
-    kpi_chart = create_kpi_cards_chart(analysis_data.get('kpis', {}), gerencia)
-    if kpi_chart:
-        charts['kpis'] = kpi_chart
-
-    monthly_chart = create_monthly_evolution_chart(analysis_data.get('evolucao_mensal', []), gerencia)
-    if monthly_chart:
-        charts['evolucao_mensal'] = monthly_chart
-
-    top_chart = create_top_materials_chart(analysis_data.get('top_materiais', []), gerencia)
-    if top_chart:
-        charts['top_materiais'] = top_chart
-
-    return charts
\ No newline at end of file
+    tasks = {
+        'kpis': (create_kpi_cards_chart, analysis_data.get('kpis', {})),
+        'evolucao_mensal': (create_monthly_evolution_chart, analysis_data.get('evolucao_mensal', [])),
+        # Sem materiais o gráfico ainda é gerado (aviso "Nenhum material encontrado")
+        'top_materiais': (create_top_materials_chart, analysis_data.get('top_materiais', [])),
+    }
+    # Sem evolução mensal não há gráfico: nem chega a ser agendado
+    if not tasks['evolucao_mensal'][1]:
+        del tasks['evolucao_mensal']
+    for name in exclude:
+        tasks.pop(name, None)
+
+    workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        results = {name: _render_chart(name, fn, arg, gerencia, dpi) for name, (fn, arg) in tasks.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = {name: ex.submit(_render_chart, name, fn, arg, gerencia, dpi) for name, (fn, arg) in tasks.items()}
+            results = {name: f.result() for name, f in futures.items()}
+
+    return {name: chart for name, chart in results.items() if chart}
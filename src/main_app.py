@@ -9,10 +9,15 @@ Compatível com:
 
 import os
 import io
+import json
+import csv
+import hashlib
 import zipfile
-import tempfile
-from typing import Dict, List, Any
+import zlib
+from datetime import datetime
+from typing import Dict, List, Any, Tuple
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
@@ -24,20 +29,25 @@ from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv(usecwd=True), override=True)
 
 load_dotenv()
-# Tenta importar dos pacotes 'ai.generative_llm' e 'ai.classic_ai'.
-# Caso esses módulos não existam, faz fallback para importar dos arquivos
-# locais 'generative_llm.py' e 'classic_ai.py'. Isso garante que o
-# aplicativo continue funcionando mesmo sem pacotes instalados.
+# Tenta importar do pacote 'ai.generative_llm'. Caso o módulo não exista,
+# faz fallback para importar do arquivo local 'generative_llm.py'. Isso
+# garante que o aplicativo continue funcionando mesmo sem pacotes instalados.
+# A IA clássica ('ai.classic_ai') só é importada quando as análises rodam
+# (ver analysis.py), evitando esse custo na inicialização da app. Do mesmo
+# modo, charts (matplotlib, ~0,5 s) só é importado ao exibir uma gerência e
+# pdf (ReportLab) ao gerar os PDFs: a tela inicial, antes do upload do CSV,
+# não paga por eles.
 try:
-    from ai.generative_llm import *  # type: ignore
-    from ai.classic_ai import *  # type: ignore
+    from ai.generative_llm import llm_enabled  # type: ignore
 except ImportError:
-    from generative_llm import *  # type: ignore
-    from classic_ai import *  # type: ignore
-from utils.formatting import safe_format_currency, safe_format_number
-from charts import generate_all_charts_for_gerencia
-from pdf import generate_pdf_for_gerencia
-from analysis import generate_all_gerencias_analysis, get_unique_gerencias
+    from generative_llm import llm_enabled  # type: ignore
+from utils.formatting import (
+    safe_format_currency,
+    safe_format_number,
+    format_currency_series,
+    format_number_series,
+)
+from analysis import generate_all_gerencias_analysis, get_unique_gerencias, load_csv_with_totals
 
 # Importa utilitários de colunas para detecção dinâmica
 from utils.columns import (
@@ -68,6 +78,19 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Conteúdo estático da sidebar, enviado ao navegador em uma única mensagem
+SIDEBAR_MD = """
+## ℹ️ Como usar
+> 1) Faça upload do CSV • 2) Selecione as gerências • 3) Gere análises e PDFs
+
+---
+## 📋 Formato do CSV
+**Colunas obrigatórias:** Gerência/Gerencia • Material • Valores mensais (ex.: `Valor Mês 01..12` ou `Jan_Valor .. Dez_Valor`)
+
+---
+## 🧠 IA Generativa
+"""
+
 # CSS leve
 st.markdown("""
 <style>
@@ -77,6 +100,47 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# -------------------------------------------------------------------
+# Carregamento de dados (com cache)
+# -------------------------------------------------------------------
+# Os caches são persistidos em disco (``.streamlit/cache``) e sobrevivem a
+# reinícios do servidor: reenviar o mesmo arquivo vira uma leitura de pickle.
+# A chave é o digest do arquivo; argumentos iniciados por "_" não entram no
+# hash do Streamlit, evitando re-hashear bytes e DataFrames a cada chamada.
+_CACHE_MAX_ENTRIES = 16
+
+
+def _file_digest(file_bytes: bytes) -> str:
+    """Digest rápido (BLAKE2b, 128 bits) do conteúdo do arquivo enviado."""
+    return hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+
+
+@st.cache_data(show_spinner=False, persist="disk", max_entries=_CACHE_MAX_ENTRIES)
+def _load_csv(key: str, _file_bytes: bytes) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Faz o parse do CSV e agrega os totais por gerência.
+
+    ``key`` é o digest de ``_file_bytes``: o mesmo arquivo enviado novamente
+    (inclusive em outra sessão ou após reiniciar o app) não é relido.
+    """
+    try:
+        return load_csv_with_totals(io.BytesIO(_file_bytes), encoding="utf-8")
+    except Exception:
+        return load_csv_with_totals(io.BytesIO(_file_bytes))  # fallback simples
+
+
+@st.cache_data(show_spinner=False, persist="disk", max_entries=_CACHE_MAX_ENTRIES)
+def _cached_all_analysis(
+    key: str, use_llm: bool, _df: pd.DataFrame, _totals: pd.DataFrame, _progress: Any = None
+) -> Dict[str, Any]:
+    """Análise completa de todas as gerências, com cache pelo digest dos dados.
+
+    ``use_llm`` entra na chave do cache para que ligar/desligar a IA
+    generativa produza um novo resumo executivo. ``_progress`` é repassado a
+    ``generate_all_gerencias_analysis``; num acerto do cache não é chamado.
+    """
+    return generate_all_gerencias_analysis(_df, _totals, progress=_progress)
+
+
 # -------------------------------------------------------------------
 # Mock (apenas se precisar rodar sem módulos ou sem dados)
 # -------------------------------------------------------------------
@@ -88,9 +152,6 @@ def generate_mock_analysis(df: pd.DataFrame, gerencia: str) -> Dict[str, Any]:
     dependência de nomes específicos. Caso alguma coluna não exista,
     utiliza valores aleatórios para simular os KPIs.
     """
-    import numpy as np
-    from datetime import datetime as _dt
-
     # Filtra DataFrame pela gerência, se possível
     col_g = get_col_gerencia(df)
     if col_g:
@@ -143,7 +204,7 @@ def generate_mock_analysis(df: pd.DataFrame, gerencia: str) -> Dict[str, Any]:
         "tabela_dados": [],
         "analises_ia": {},
         "metricas_colunas": {},
-        "timestamp": _dt.now().isoformat(),
+        "timestamp": datetime.now().isoformat(),
         "status": "sucesso",
     }
 
@@ -153,25 +214,40 @@ def generate_mock_analysis(df: pd.DataFrame, gerencia: str) -> Dict[str, Any]:
 # -------------------------------------------------------------------
 def display_gerencia_analysis(analysis_data: Dict[str, Any]) -> None:
     """Bloco de visualização para uma gerência específica."""
+    from charts import (
+        CHART_BACKEND,
+        create_monthly_evolution_chart_plotly,
+        generate_all_charts_for_gerencia,
+    )
+
     gerencia = analysis_data.get("gerencia", "N/A")
     kpis = analysis_data.get("kpis", {})
+    valor_total, num_materiais, quantidade_total, variacao = (
+        kpis.get(k, 0) or 0 for k in ("valor_total", "numero_materiais", "quantidade_total", "variacao_mensal")
+    )
+    valor_total, num_materiais, variacao = float(valor_total), int(num_materiais), float(variacao)
 
     st.subheader(f"📊 {gerencia}")
 
     # KPIs (formatação BR)
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("💰 Valor Total", safe_format_currency(kpis.get("valor_total", 0)))
+        st.metric("💰 Valor Total", safe_format_currency(valor_total))
     with col2:
-        st.metric("📦 Materiais", safe_format_number(kpis.get("numero_materiais", 0)))
+        st.metric("📦 Materiais", safe_format_number(num_materiais))
     with col3:
-        st.metric("📊 Quantidade", safe_format_number(kpis.get("quantidade_total", 0)))
+        st.metric("📊 Quantidade", safe_format_number(quantidade_total))
     with col4:
-        variacao = float(kpis.get("variacao_mensal", 0) or 0)
         st.metric("📈 Variação %", f"{variacao:+.1f}%")
 
-    # Gráficos (via charts)
-    charts = generate_all_charts_for_gerencia(analysis_data)
+    # Gráficos (via charts). Com CHART_BACKEND=plotly a evolução mensal vai
+    # ao navegador como JSON interativo, sem rasterizar a imagem.
+    evolucao_json = None
+    if CHART_BACKEND == "plotly":
+        evolucao_json = create_monthly_evolution_chart_plotly(analysis_data.get("evolucao_mensal", []), gerencia)
+    charts = generate_all_charts_for_gerencia(
+        analysis_data, exclude=("evolucao_mensal",) if evolucao_json else ()
+    )
     col_left, col_right = st.columns(2)
     with col_left:
         if charts.get("top_materiais"):
@@ -180,7 +256,10 @@ def display_gerencia_analysis(analysis_data: Dict[str, Any]) -> None:
         else:
             st.info("Dados de materiais não disponíveis.")
     with col_right:
-        if charts.get("evolucao_mensal"):
+        if evolucao_json:
+            st.markdown("**📊 Evolução Mensal**")
+            st.plotly_chart(json.loads(evolucao_json), use_container_width=True)
+        elif charts.get("evolucao_mensal"):
             st.markdown("**📊 Evolução Mensal**")
             st.image(charts["evolucao_mensal"], use_container_width=True)
         else:
@@ -188,9 +267,6 @@ def display_gerencia_analysis(analysis_data: Dict[str, Any]) -> None:
 
     # Insights simples baseados nos números (lado cliente)
     st.markdown("### 🤖 Insights de IA")
-    valor_total = float(kpis.get('valor_total', 0) or 0)
-    variacao = float(kpis.get('variacao_mensal', 0) or 0)
-    num_materiais = int(kpis.get('numero_materiais', 0) or 0)
 
     insights = []
     if valor_total > 1_000_000:
@@ -212,12 +288,11 @@ def display_gerencia_analysis(analysis_data: Dict[str, Any]) -> None:
     elif num_materiais < 10:
         insights.append("🎯 **Poucos materiais** — gestão mais focada possível.")
 
-    for ins in insights:
-        st.markdown(f'<div class="ai-insight">{ins}</div>', unsafe_allow_html=True)
+    # Um único bloco HTML para todos os insights (uma mensagem ao navegador)
+    st.markdown("".join(f'<div class="ai-insight">{ins}</div>' for ins in insights), unsafe_allow_html=True)
 
     # --- Resumo Executivo (IA) vindo do backend (classic_ai → generative_llm) ---
-    ai_data = analysis_data.get("analises_ia", {}) or {}
-    resumo_ia = ai_data.get("resumo_executivo", {})
+    resumo_ia = (analysis_data.get("analises_ia", {}) or {}).get("resumo_executivo", {})
 
     if isinstance(resumo_ia, dict):
         status_ia = resumo_ia.get("status")
@@ -229,22 +304,205 @@ def display_gerencia_analysis(analysis_data: Dict[str, Any]) -> None:
         elif resumo_ia.get("mensagem"):
             st.info(f"IA: {resumo_ia['mensagem']}")
 
+
+# Ganho mínimo do deflate (tamanho comprimido / original) para valer a pena.
+_ZIP_MAX_RATIO = 0.9
+_ZIP_PROBE_BYTES = 256 * 1024
+
+
+def _zip_compression_for(sample: bytes) -> int:
+    """Escolhe a compressão do ZIP a partir de uma amostra (o primeiro PDF).
+
+    Os PDFs já trazem imagens e fluxos comprimidos; se o deflate nível 1 não
+    reduzir a amostra de forma relevante, os arquivos são apenas armazenados.
+    """
+    probe = sample[:_ZIP_PROBE_BYTES]
+    if probe and len(zlib.compress(probe, 1)) / len(probe) > _ZIP_MAX_RATIO:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def show_analyses() -> None:
+    """Exibe resumo, análises detalhadas e downloads das gerências processadas.
+
+    Os resultados vêm de ``st.session_state``. Chamada dentro do fragmento
+    ``_analysis_section``, que delimita os reruns dos widgets deste bloco.
+    """
+    results: Dict[str, Any] = st.session_state.get("results", {})
+    if not results:
+        return
+
+    # Resumo
+    st.header("📈 Resumo Geral")
+    total_valor = sum(r.get('kpis', {}).get('valor_total', 0) for r in results.values())
+    total_materiais = sum(r.get('kpis', {}).get('numero_materiais', 0) for r in results.values())
+    total_quantidade = sum(r.get('kpis', {}).get('quantidade_total', 0) for r in results.values())
+
+    c1, c2, c3, c4 = st.columns(4)
+    with c1: st.metric("💰 Valor Total (selecionadas)", safe_format_currency(total_valor))
+    with c2: st.metric("📦 Materiais (soma)", safe_format_number(total_materiais))
+    with c3: st.metric("📊 Quantidade (soma)", safe_format_number(total_quantidade))
+    with c4: st.metric("🏢 Gerências", len(results))
+
+    st.markdown("---")
+    st.header("📊 Análises Detalhadas por Gerência")
+    for g, data in results.items():
+        # Exibe KPIs, gráficos, insights e resumo (função helper)
+        display_gerencia_analysis(data)
+
+        # Exibe estatísticas de colunas numéricas adicionais, se existirem
+        extra_stats = data.get("metricas_colunas", {}) or {}
+        if extra_stats:
+            with st.expander("📊 Estatísticas por Coluna (Total e Média)", expanded=False):
+                stats = pd.DataFrame.from_dict(extra_stats, orient="index").reindex(columns=["total", "media"])
+                # Formatação condicional para colunas que parecem valores monetários
+                is_valor = stats.index.astype(str).str.lower().str.contains("valor", regex=False)
+                df_stats = pd.DataFrame({
+                    "Total": format_currency_series(stats["total"]).where(is_valor, format_number_series(stats["total"])),
+                    "Média": format_currency_series(stats["media"]).where(is_valor, format_number_series(stats["media"])),
+                }).rename_axis("Coluna").reset_index()
+                st.dataframe(df_stats, use_container_width=True)
+
+        st.markdown("---")
+
+    # Downloads
+    st.header("📥 Downloads e Relatórios")
+    cdl1, cdl2 = st.columns(2)
+
+    # Export CSV
+    with cdl1:
+        export_rows = []
+        for g, r in results.items():
+            k = r.get("kpis", {})
+            export_rows.append({
+                "Gerencia": g,
+                "Valor_Total": k.get("valor_total", 0),
+                "Numero_Materiais": k.get("numero_materiais", 0),
+                "Quantidade_Total": k.get("quantidade_total", 0),
+                "Variacao_Mensal": k.get("variacao_mensal", 0),
+                "Status": r.get("status", "N/A"),
+                "Timestamp": r.get("timestamp", ""),
+            })
+        # Poucas linhas, só para exportar: escreve direto com csv, sem montar DataFrame
+        csv_buf = io.StringIO()
+        writer = csv.DictWriter(csv_buf, fieldnames=list(export_rows[0]), lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(export_rows)
+        st.download_button(
+            label="⬇️ Baixar CSV Processado",
+            data=csv_buf.getvalue().encode("utf-8"),
+            file_name=f"analise_estoque_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            use_container_width=True,
+        )
+
+    # PDFs (zip) das gerências selecionadas.
+    # O ZIP fica em sessão, associado ao arquivo carregado e às gerências
+    # incluídas: outros reruns mantêm o botão de download sem gerar de novo.
+    zip_key = f"zip_{st.session_state.get('data_key', '')}"
+    zip_gerencias = tuple(results)
+    with cdl2:
+        if st.button("📄 Gerar PDFs (ZIP) das Selecionadas", use_container_width=True):
+            n_pdfs = sum(1 for r in results.values() if (r or {}).get("status") == "sucesso")
+            with st.status(f"Gerando {n_pdfs} PDF(s)...", expanded=False) as status:
+                try:
+                    from pdf import generate_all_pdfs_streaming
+
+                    # Gera um PDF por gerência selecionada (dados já calculados) e
+                    # escreve cada um direto no ZIP em memória, sem passar pelo disco
+                    mem_zip = io.BytesIO()
+                    compression = None
+                    with zipfile.ZipFile(mem_zip, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+                        for i, (pdf_name, pdf_bytes) in enumerate(generate_all_pdfs_streaming({"analises": results}), 1):
+                            if compression is None:
+                                compression = _zip_compression_for(pdf_bytes)
+                            zf.writestr(pdf_name, pdf_bytes, compress_type=compression)
+                            status.update(label=f"PDF {i}/{n_pdfs}: {pdf_name}")
+                    st.session_state[zip_key] = (zip_gerencias, mem_zip.getvalue())
+                    status.update(label=f"✅ {n_pdfs} PDF(s) gerado(s)", state="complete")
+                except Exception as e:
+                    status.update(label="Falha ao gerar PDFs", state="error")
+                    st.error(f"Erro ao gerar PDFs: {e}")
+
+        cached_zip = st.session_state.get(zip_key)
+        if cached_zip and cached_zip[0] == zip_gerencias:
+            st.download_button(
+                label="⬇️ Baixar ZIP com PDFs",
+                data=cached_zip[1],
+                file_name=f"relatorios_estoque_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip",
+                use_container_width=True,
+            )
+
+
 # -------------------------------------------------------------------
 # App
 # -------------------------------------------------------------------
+@st.fragment
+def _analysis_section(df: pd.DataFrame, totals: pd.DataFrame, gerencias: List[str]) -> None:
+    """Seleção de gerências, geração das análises e exibição dos resultados.
+
+    É o único fragmento da app: mudar a seleção ou usar os widgets dos
+    resultados (ex.: o botão de PDFs de ``show_analyses``) reexecuta apenas
+    este bloco; sidebar, upload, preview e validações acima não são refeitos.
+    """
+    st.header("🎯 Análise por Gerência")
+    col_sel, col_btn = st.columns([3, 1])
+    with col_sel:
+        selected_gerencias = st.multiselect(
+            "Escolha as gerências para análise:",
+            gerencias,
+            default=gerencias[:3] if len(gerencias) > 3 else gerencias,
+        )
+    with col_btn:
+        if st.button("Selecionar Todas", type="secondary", use_container_width=True):
+            selected_gerencias = gerencias
+            st.experimental_rerun()
+
+    if not selected_gerencias:
+        st.warning("⚠️ Selecione pelo menos uma gerência para continuar.")
+        return
+
+    # Geração das análises (uma única vez)
+    if st.button("🚀 Gerar Análises com IA", type="primary", use_container_width=True):
+        with st.status(f"Analisando {len(gerencias)} gerência(s)...", expanded=False) as status:
+            try:
+                def _progress(feitas: int, total: int, gerencia: str) -> None:
+                    status.update(label=f"Gerência {feitas}/{total}: {gerencia}")
+
+                full_result = _cached_all_analysis(
+                    st.session_state["data_key"], llm_enabled(), df, totals, _progress
+                )
+                if full_result.get("status") != "sucesso":
+                    st.warning("Falha ao gerar análises completas. Usando mock para as selecionadas.")
+                    results = {g: generate_mock_analysis(df, g) for g in selected_gerencias}
+                else:
+                    analises = full_result.get("analises", {})
+                    # filtra apenas as selecionadas; se faltar alguma, cria mock
+                    results = {}
+                    for g in selected_gerencias:
+                        if g in analises and analises[g].get("status") == "sucesso":
+                            results[g] = analises[g]
+                        else:
+                            results[g] = generate_mock_analysis(df, g)
+                st.session_state["results"] = results
+                status.update(label="✅ Análises concluídas!", state="complete")
+            except Exception as e:
+                status.update(label="Falha nas análises", state="error")
+                st.error(f"Erro ao gerar análises: {e}")
+                st.session_state["results"] = {g: generate_mock_analysis(df, g) for g in selected_gerencias}
+
+    # Exibição se houver resultados em sessão
+    show_analyses()
+
+
 def main():
     st.markdown('<h1 class="main-header">🤖 Análise Inteligente de Estoque Excedente</h1>', unsafe_allow_html=True)
     st.markdown("### Sistema com IA para Gestão de Estoque por Gerência")
     st.markdown("---")
 
     with st.sidebar:
-        st.header("ℹ️ Como usar")
-        st.info("1) Faça upload do CSV • 2) Selecione as gerências • 3) Gere análises e PDFs")
-        st.header("📋 Formato do CSV")
-        st.markdown(
-            "**Colunas obrigatórias:** Gerência/Gerencia • Material • "
-            "Valores mensais (ex.: `Valor Mês 01..12` ou `Jan_Valor .. Dez_Valor`)")
-        st.header("🧠 IA Generativa")
+        st.markdown(SIDEBAR_MD)
         use_llm_ui = st.toggle("Ativar LLM (OpenAI)", value=os.getenv("USE_LLM","0") in ("1","true","yes","on"))
         # sincroniza com o processo atual (não persiste fora da sessão)
         os.environ["USE_LLM"] = "1" if use_llm_ui else "0"
@@ -261,24 +519,39 @@ def main():
     if uploaded_file is None:
         st.stop()
 
-    # Carregar dados
-    try:
-        df = pd.read_csv(uploaded_file, encoding="utf-8")
-    except Exception:
-        df = pd.read_csv(uploaded_file)  # fallback simples
+    # Carregar dados (em blocos, acumulando os totais por gerência na leitura).
+    # O DataFrame e os totais ficam em sessão: reruns com o mesmo upload não
+    # fazem um novo parse do CSV. O arquivo é lido uma única vez, do início,
+    # independentemente de leituras anteriores no mesmo objeto.
+    upload_key = (uploaded_file.name, uploaded_file.size, uploaded_file.file_id)
+    if st.session_state.get("upload_key") != upload_key:
+        uploaded_file.seek(0)
+        file_bytes = uploaded_file.read()
+        data_key = _file_digest(file_bytes)
+        df, totals = _load_csv(data_key, file_bytes)
+        st.session_state["data_key"] = data_key
+        st.session_state["df"] = df
+        st.session_state["totals"] = totals
+        st.session_state["gerencias"] = get_unique_gerencias(df)
+        # Números do preview, calculados uma vez por upload
+        col_g = get_col_gerencia(df)
+        st.session_state["preview_stats"] = (len(df), len(df.columns), df[col_g].nunique() if col_g else None)
+        st.session_state["upload_key"] = upload_key
+    df = st.session_state["df"]
+    totals = st.session_state["totals"]
     st.success("✅ Arquivo carregado com sucesso!")
 
     # Preview
     with st.expander("👀 Preview dos Dados", expanded=False):
         st.dataframe(df.head(10), use_container_width=True)
+        n_registros, n_colunas, n_gerencias = st.session_state["preview_stats"]
         c1, c2, c3 = st.columns(3)
-        with c1: st.metric("📊 Registros", len(df))
-        with c2: st.metric("📋 Colunas", len(df.columns))
+        with c1: st.metric("📊 Registros", n_registros)
+        with c2: st.metric("📋 Colunas", n_colunas)
         with c3:
-            # Usa detecção dinâmica para contar gerências
-            col_g = get_col_gerencia(df)
-            if col_g:
-                st.metric("🏢 Gerências", df[col_g].nunique())
+            # Contagem via detecção dinâmica da coluna de gerência
+            if n_gerencias is not None:
+                st.metric("🏢 Gerências", n_gerencias)
 
     # Validação mínima (detecção flexível)
     col_g = get_col_gerencia(df)
@@ -295,151 +568,13 @@ def main():
         st.error("❌ Colunas de valor mensal não encontradas (use 'Valor Mês 01..12' ou 'Jan_Valor..Dez_Valor').")
         st.stop()
 
-    # Gerências
-    gerencias = get_unique_gerencias(df)
+    # Gerências (calculadas uma vez por upload)
+    gerencias = st.session_state["gerencias"]
     if not gerencias:
         st.error("❌ Nenhuma gerência válida encontrada.")
         st.stop()
 
-    st.header("🎯 Análise por Gerência")
-    col_sel, col_btn = st.columns([3, 1])
-    with col_sel:
-        selected_gerencias = st.multiselect(
-            "Escolha as gerências para análise:",
-            gerencias,
-            default=gerencias[:3] if len(gerencias) > 3 else gerencias,
-        )
-    with col_btn:
-        if st.button("Selecionar Todas", type="secondary", use_container_width=True):
-            selected_gerencias = gerencias
-            st.experimental_rerun()
-
-    if not selected_gerencias:
-        st.warning("⚠️ Selecione pelo menos uma gerência para continuar.")
-        st.stop()
-
-    # Geração das análises (uma única vez)
-    if st.button("🚀 Gerar Análises com IA", type="primary", use_container_width=True):
-        with st.spinner("Processando análises..."):
-            try:
-                full_result = generate_all_gerencias_analysis(df)
-                if full_result.get("status") != "sucesso":
-                    st.warning("Falha ao gerar análises completas. Usando mock para as selecionadas.")
-                    results = {g: generate_mock_analysis(df, g) for g in selected_gerencias}
-                else:
-                    analises = full_result.get("analises", {})
-                    # filtra apenas as selecionadas; se faltar alguma, cria mock
-                    results = {}
-                    for g in selected_gerencias:
-                        if g in analises and analises[g].get("status") == "sucesso":
-                            results[g] = analises[g]
-                        else:
-                            results[g] = generate_mock_analysis(df, g)
-                st.session_state["results"] = results
-                st.success("✅ Análises concluídas!")
-            except Exception as e:
-                st.error(f"Erro ao gerar análises: {e}")
-                st.session_state["results"] = {g: generate_mock_analysis(df, g) for g in selected_gerencias}
-
-    # Exibição se houver resultados em sessão
-    results: Dict[str, Any] = st.session_state.get("results", {})
-    if results:
-        # Resumo
-        st.header("📈 Resumo Geral")
-        total_valor = sum(r.get('kpis', {}).get('valor_total', 0) for r in results.values())
-        total_materiais = sum(r.get('kpis', {}).get('numero_materiais', 0) for r in results.values())
-        total_quantidade = sum(r.get('kpis', {}).get('quantidade_total', 0) for r in results.values())
-
-        c1, c2, c3, c4 = st.columns(4)
-        with c1: st.metric("💰 Valor Total (selecionadas)", safe_format_currency(total_valor))
-        with c2: st.metric("📦 Materiais (soma)", safe_format_number(total_materiais))
-        with c3: st.metric("📊 Quantidade (soma)", safe_format_number(total_quantidade))
-        with c4: st.metric("🏢 Gerências", len(results))
-
-        st.markdown("---")
-        st.header("📊 Análises Detalhadas por Gerência")
-        for g, data in results.items():
-            # Exibe KPIs, gráficos, insights e resumo (função helper)
-            display_gerencia_analysis(data)
-
-            # Exibe estatísticas de colunas numéricas adicionais, se existirem
-            extra_stats = data.get("metricas_colunas", {}) or {}
-            if extra_stats:
-                with st.expander("📊 Estatísticas por Coluna (Total e Média)", expanded=False):
-                    rows: List[Dict[str, Any]] = []
-                    for col_name, stats in extra_stats.items():
-                        total = stats.get("total", 0.0)
-                        media = stats.get("media", 0.0)
-                        # Formatação condicional para colunas que parecem valores monetários
-                        if "valor" in str(col_name).lower():
-                            total_fmt = safe_format_currency(total)
-                            media_fmt = safe_format_currency(media)
-                        else:
-                            total_fmt = safe_format_number(total)
-                            media_fmt = safe_format_number(media)
-                        rows.append({"Coluna": col_name, "Total": total_fmt, "Média": media_fmt})
-                    df_stats = pd.DataFrame(rows)
-                    st.dataframe(df_stats, use_container_width=True)
-
-            st.markdown("---")
-
-        # Downloads
-        st.header("📥 Downloads e Relatórios")
-        cdl1, cdl2 = st.columns(2)
-
-        # Export CSV
-        with cdl1:
-            export_rows = []
-            for g, r in results.items():
-                k = r.get("kpis", {})
-                export_rows.append({
-                    "Gerencia": g,
-                    "Valor_Total": k.get("valor_total", 0),
-                    "Numero_Materiais": k.get("numero_materiais", 0),
-                    "Quantidade_Total": k.get("quantidade_total", 0),
-                    "Variacao_Mensal": k.get("variacao_mensal", 0),
-                    "Status": r.get("status", "N/A"),
-                    "Timestamp": r.get("timestamp", ""),
-                })
-            df_export = pd.DataFrame(export_rows)
-            st.download_button(
-                label="⬇️ Baixar CSV Processado",
-                data=df_export.to_csv(index=False).encode("utf-8"),
-                file_name=f"analise_estoque_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                use_container_width=True,
-            )
-
-        # PDFs (zip) das gerências selecionadas
-        with cdl2:
-            if st.button("📄 Gerar PDFs (ZIP) das Selecionadas", use_container_width=True):
-                try:
-                    with tempfile.TemporaryDirectory() as tmpdir:
-                        # Gera um PDF por gerência selecionada utilizando os dados já calculados
-                        pdf_paths: List[str] = []
-                        for g, data in results.items():
-                            safe_name = "".join(c for c in str(g) if c.isalnum() or c in (" ", "-", ".")).strip().replace(" ", "_")
-                            pdf_path = os.path.join(tmpdir, f"Relatorio_Estoque_{safe_name or 'Relatorio'}.pdf")
-                            generate_pdf_for_gerencia(data, pdf_path)
-                            pdf_paths.append(pdf_path)
-
-                        # Compacta em ZIP na memória
-                        mem_zip = io.BytesIO()
-                        with zipfile.ZipFile(mem_zip, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
-                            for p in pdf_paths:
-                                zf.write(p, arcname=os.path.basename(p))
-                        mem_zip.seek(0)
-
-                    st.download_button(
-                        label="⬇️ Baixar ZIP com PDFs",
-                        data=mem_zip.getvalue(),
-                        file_name=f"relatorios_estoque_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.zip",
-                        mime="application/zip",
-                        use_container_width=True,
-                    )
-                except Exception as e:
-                    st.error(f"Erro ao gerar PDFs: {e}")
-
+    _analysis_section(df, totals, gerencias)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
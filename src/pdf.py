@@ -5,11 +5,15 @@ Nome do arquivo: pdf.py
 
 from __future__ import annotations
 
+import gc
+import multiprocessing as mp
 import os
 import io
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import pandas as pd
 from reportlab.lib import colors
@@ -30,16 +34,20 @@ from reportlab.platypus import (
 )
 
 # Imports locais
-from charts import generate_all_charts_for_gerencia
-from utils.formatting import safe_format_currency, safe_format_number  # <- usa utils
+from charts import generate_combined_chart_for_gerencia, kpi_card_specs
+from utils.formatting import format_currency_list  # <- usa utils
 
 # ---------------------------------------------------------------------
 # Utilitários
 # ---------------------------------------------------------------------
+@lru_cache(maxsize=1)
 def setup_fonts() -> tuple[str, str]:
     """
     Configura as fontes para o PDF.
     Retorna (fonte_normal, fonte_bold).
+
+    Registrar a fonte re-lê o TTF, então o resultado fica em cache: uma
+    leitura por processo (inclusive em cada worker do pool de PDFs).
     """
     try:
         font_paths = {
@@ -61,22 +69,80 @@ def setup_fonts() -> tuple[str, str]:
         return "Helvetica", "Helvetica-Bold"
 
 
-def _image_from_buffer(buf: io.BytesIO, tmp_files: List[str], max_w: float, max_h: float) -> Image:
+def _image_from_buffer(buf: io.BytesIO, max_w: float, max_h: float) -> Image:
     """
-    Converte um BytesIO de imagem em um PNG temporário e devolve um Flowable Image.
-    Registra o caminho para remoção posterior.
+    Devolve um Flowable Image lendo a imagem direto do BytesIO (PNG ou JPEG),
+    sem passar por arquivo temporário.
     """
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    tmp.write(buf.getvalue())
-    tmp.flush()
-    tmp.close()
-    tmp_files.append(tmp.name)
-
-    img = Image(tmp.name)
+    buf.seek(0)
+    img = Image(buf)
     img._restrictSize(max_w, max_h)
     return img
 
 
+def _kpi_cards_table(kpis: Dict[str, Any], font_name: str, bold_font_name: str) -> Table:
+    """
+    Cards de KPI (2x2) como tabela do ReportLab, com as cores dos cards do
+    gráfico: texto vetorial no PDF, sem desenhar e comprimir uma imagem.
+    """
+    titulo_style = ParagraphStyle(
+        name="kpi_titulo", fontName=bold_font_name, fontSize=12, leading=15, alignment=TA_CENTER
+    )
+    cards = kpi_card_specs(kpis)
+    celulas = [
+        [
+            Paragraph(titulo, titulo_style),
+            Paragraph(
+                valor,
+                ParagraphStyle(
+                    name="kpi_valor",
+                    fontName=bold_font_name,
+                    fontSize=18,
+                    leading=22,
+                    alignment=TA_CENTER,
+                    textColor=colors.HexColor(cor),
+                ),
+            ),
+        ]
+        for titulo, valor, cor, _ in cards
+    ]
+    comandos: List[Tuple[Any, ...]] = [
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+        ("TOPPADDING", (0, 0), (-1, -1), 12),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 12),
+    ]
+    for i, (_, _, cor, fundo) in enumerate(cards):
+        celula = (i % 2, i // 2)
+        comandos.append(("BACKGROUND", celula, celula, colors.HexColor(fundo)))
+        comandos.append(("BOX", celula, celula, 1.5, colors.HexColor(cor)))
+
+    return Table([celulas[0:2], celulas[2:4]], colWidths=[3.4 * inch] * 2, style=TableStyle(comandos))
+
+
+def _cell_text(value: Any) -> str:
+    """Texto de uma célula da tabela; ausentes (None/NaN/NA) ficam em branco."""
+    if value is None or value is pd.NA or value != value:
+        return ""
+    return str(value)
+
+
+def _table_rows(registros: List[Dict[str, Any]]) -> List[List[Any]]:
+    """
+    Cabeçalho e linhas da tabela de dados, já como texto, a partir dos
+    registros (lista de dicts) direto, sem montar um DataFrame: as colunas
+    são percorridas uma vez, e as monetárias (nome com "valor") formatadas
+    de uma só vez.
+    """
+    colunas = list(dict.fromkeys(k for r in registros for k in r))
+    textos = [
+        format_currency_list([r.get(col) for r in registros])
+        if "valor" in str(col).lower()
+        else [_cell_text(r.get(col)) for r in registros]
+        for col in colunas
+    ]
+    return [colunas, *map(list, zip(*textos))]
+
+
 def _sanitize_filename(name: str) -> str:
     """
     Remove caracteres problemáticos para nome de arquivo.
@@ -89,7 +155,7 @@ def _sanitize_filename(name: str) -> str:
 # ---------------------------------------------------------------------
 # Geração de PDF - por gerência
 # ---------------------------------------------------------------------
-def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: str) -> None:
+def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: Union[str, IO[bytes]]) -> None:
     """
     Gera um relatório PDF para uma gerência específica.
 
@@ -97,10 +163,9 @@ def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: str) -> N
         analysis_data: Dicionário com a análise completa da gerência.
                        Espera chaves: 'gerencia', 'kpis', 'evolucao_mensal',
                        'top_materiais', 'tabela_dados', 'analises_ia'
-        pdf_path: Caminho para salvar o PDF.
+        pdf_path: Caminho para salvar o PDF ou objeto arquivo binário
+                  (ex.: ``io.BytesIO``) que receberá o conteúdo.
     """
-    tmp_files: List[str] = []
-
     try:
         # Documento
         doc = SimpleDocTemplate(
@@ -166,20 +231,20 @@ def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: str) -> N
         # -----------------------------------------------------------------
         story.append(Paragraph("1. Visão Geral e KPIs", h2_style))
 
-        charts = generate_all_charts_for_gerencia(analysis_data)
-
-        if charts.get("kpis"):
-            story.append(_image_from_buffer(charts["kpis"], tmp_files, 7 * inch, 4.5 * inch))
-            story.append(Spacer(1, 0.2 * inch))
-
-        if charts.get("evolucao_mensal"):
-            story.append(Paragraph("Evolução Mensal do Estoque Excedente", h3_style))
-            story.append(_image_from_buffer(charts["evolucao_mensal"], tmp_files, 7 * inch, 3.5 * inch))
-            story.append(Spacer(1, 0.2 * inch))
-
-        if charts.get("top_materiais"):
-            story.append(Paragraph("Top 10 Materiais por Valor", h3_style))
-            story.append(_image_from_buffer(charts["top_materiais"], tmp_files, 7 * inch, 4 * inch))
+        # KPIs como tabela; evolução mensal e top materiais num único painel:
+        # uma imagem (rasterizada e comprimida uma vez) em vez de três. Cada
+        # gráfico do painel traz o próprio título, então há um só subtítulo
+        story.append(_kpi_cards_table(analysis_data.get("kpis", {}) or {}, font_name, bold_font_name))
+        story.append(Spacer(1, 0.2 * inch))
+        try:
+            painel = generate_combined_chart_for_gerencia(analysis_data, include_kpis=False)
+        except Exception as e:
+            # Falha de desenho só tira o painel do relatório, não o PDF inteiro
+            print(f"Erro ao gerar o painel de gráficos de {gerencia}: {e}")
+            painel = None
+        if painel:
+            story.append(Paragraph("Evolução Mensal e Top 10 Materiais por Valor", h3_style))
+            story.append(_image_from_buffer(painel, 7 * inch, 7.5 * inch))
 
         story.append(PageBreak())
 
@@ -198,21 +263,6 @@ def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: str) -> N
             story.append(Paragraph(resumo_text, normal_style))
             story.append(Spacer(1, 0.2 * inch))
 
-        # Gráficos gerados de IA (se existirem no dicionário charts)
-        if charts.get("previsao"):
-            story.append(Paragraph("Análise Preditiva", h3_style))
-            story.append(_image_from_buffer(charts["previsao"], tmp_files, 7 * inch, 3.5 * inch))
-            story.append(Spacer(1, 0.2 * inch))
-
-        if charts.get("anomalias"):
-            story.append(Paragraph("Detecção de Anomalias", h3_style))
-            story.append(_image_from_buffer(charts["anomalias"], tmp_files, 7 * inch, 3.5 * inch))
-            story.append(Spacer(1, 0.2 * inch))
-
-        if charts.get("recomendacoes"):
-            story.append(Paragraph("Recomendações de Ações (IA)", h3_style))
-            story.append(_image_from_buffer(charts["recomendacoes"], tmp_files, 7 * inch, 4 * inch))
-
         story.append(PageBreak())
 
         # -----------------------------------------------------------------
@@ -222,15 +272,7 @@ def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: str) -> N
 
         tabela_dados = analysis_data.get("tabela_dados", [])
         if tabela_dados:
-            df_tabela = pd.DataFrame(tabela_dados).copy()
-
-            # Formatação básica de colunas monetárias
-            for col in df_tabela.columns:
-                if "valor" in str(col).lower():
-                    df_tabela[col] = df_tabela[col].apply(safe_format_currency)
-
-            data_list = [df_tabela.columns.tolist()] + df_tabela.values.tolist()
-            table = Table(data_list, repeatRows=1)
+            table = Table(_table_rows(tabela_dados), repeatRows=1)
 
             style = TableStyle(
                 [
@@ -254,46 +296,169 @@ def generate_pdf_for_gerencia(analysis_data: Dict[str, Any], pdf_path: str) -> N
     except Exception as e:
         raise Exception(f"Erro ao gerar PDF para {analysis_data.get('gerencia', 'Desconhecida')}: {e}")
 
-    finally:
-        # Limpeza de arquivos temporários
-        for f in tmp_files:
-            try:
-                os.remove(f)
-            except Exception:
-                pass
+
+def generate_pdf_bytes_for_gerencia(analysis_data: Dict[str, Any]) -> bytes:
+    """
+    Gera o relatório PDF de uma gerência em memória, sem gravar em disco.
+
+    Returns:
+        Conteúdo do PDF.
+    """
+    buf = io.BytesIO()
+    generate_pdf_for_gerencia(analysis_data, buf)
+    return buf.getvalue()
 
 
 # ---------------------------------------------------------------------
 # Geração em lote
 # ---------------------------------------------------------------------
-def generate_all_pdfs(all_analysis_data: Dict[str, Any], output_dir: str) -> List[str]:
+# Número de PDFs renderizados por lote em ``generate_all_pdfs_streaming``.
+PDF_BATCH_SIZE = 8
+# Até este número de PDFs a geração é sequencial: cada processo do pool
+# reimporta pandas, matplotlib e ReportLab (segundos), mais do que custa
+# renderizar poucos relatórios.
+PDF_SERIAL_MAX = PDF_BATCH_SIZE
+
+
+def _pdf_workers(n_pdfs: int, max_workers: Optional[int]) -> int:
+    """Processos para ``n_pdfs`` relatórios; 1 significa geração sequencial."""
+    if n_pdfs <= PDF_SERIAL_MAX:
+        return 1
+    return max_workers or os.cpu_count() or 1
+
+
+@lru_cache(maxsize=None)
+def _pdf_process_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Pool de processos para renderizar PDFs. Usa o método "spawn": um fork do
+    processo da app (com threads do Streamlit, locks do matplotlib e do
+    ReportLab possivelmente ocupados) não é seguro, e no macOS o fork nem é
+    suportado por essas bibliotecas.
+
+    O pool é criado uma vez por número de processos e reaproveitado entre
+    chamadas, para não repetir o import das bibliotecas em cada worker.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"))
+
+
+def _pool_map(workers: int, fn: Any, items: List[Any]) -> List[Any]:
+    """``map`` no pool compartilhado; um pool quebrado é descartado."""
+    try:
+        return list(_pdf_process_pool(workers).map(fn, items))
+    except BrokenProcessPool:
+        _pdf_process_pool.cache_clear()
+        raise
+
+
+def _pdf_filename(gerencia: str) -> str:
+    return f"Relatorio_Estoque_{_sanitize_filename(gerencia)}.pdf"
+
+
+def _write_one_pdf(item: Tuple[str, Dict[str, Any], str]) -> str:
+    """Gera o PDF de uma gerência em ``output_dir`` e devolve o caminho."""
+    gerencia, analysis_data, output_dir = item
+    pdf_path = os.path.join(output_dir, _pdf_filename(gerencia))
+    generate_pdf_for_gerencia(analysis_data, pdf_path)
+    return pdf_path
+
+
+def _render_one_pdf(item: Tuple[str, Dict[str, Any]]) -> Tuple[str, bytes]:
+    """
+    Renderiza o PDF de uma única gerência.
+
+    Definida no nível do módulo para poder ser enviada (pickle) aos
+    processos do ``ProcessPoolExecutor``.
+    """
+    gerencia, analysis_data = item
+    return _pdf_filename(gerencia), generate_pdf_bytes_for_gerencia(analysis_data)
+
+
+def generate_all_pdfs_streaming(
+    all_analysis_data: Dict[str, Any],
+    max_workers: Optional[int] = None,
+    batch_size: int = PDF_BATCH_SIZE,
+) -> Iterator[Tuple[str, bytes]]:
+    """
+    Gera os PDFs de todas as gerências em memória.
+
+    Variante de ``generate_all_pdfs`` que não grava arquivos: cada PDF é
+    entregue assim que fica pronto, permitindo escrevê-lo direto em um ZIP.
+    As gerências são independentes entre si, então a renderização
+    (matplotlib + reportlab, limitada por CPU) é distribuída em processos,
+    um por gerência, até o número de núcleos disponíveis. Com até
+    ``PDF_SERIAL_MAX`` PDFs a geração é sequencial.
+
+    As gerências são processadas em lotes de ``batch_size``: ao fim de cada
+    lote as referências são liberadas e o coletor de lixo é acionado, de modo
+    que o pico de memória depende do tamanho do lote, não do total de PDFs.
+
+    Args:
+        all_analysis_data: Dicionário com análises de todas as gerências.
+                           Espera um mapeamento em all_analysis_data["analises"].
+        max_workers: Limite de processos. Padrão: ``os.cpu_count()``.
+                     Com 1 (ou uma única gerência) a geração é sequencial.
+        batch_size: Número de PDFs renderizados por lote.
+
+    Yields:
+        Tuplas ``(nome_do_arquivo, conteudo_pdf)``, na ordem das gerências.
+    """
+    analises: Dict[str, Dict[str, Any]] = all_analysis_data.get("analises", {}) or {}
+    payloads = [
+        (gerencia, analysis_data)
+        for gerencia, analysis_data in analises.items()
+        if (analysis_data or {}).get("status") == "sucesso"
+    ]
+
+    workers = _pdf_workers(len(payloads), max_workers)
+    step = max(1, batch_size)
+    for start in range(0, len(payloads), step):
+        batch = payloads[start:start + step]
+        if workers <= 1:
+            rendered = [_render_one_pdf(item) for item in batch]
+        else:
+            rendered = _pool_map(workers, _render_one_pdf, batch)
+        yield from rendered
+        del rendered
+        gc.collect()
+
+
+def generate_all_pdfs(
+    all_analysis_data: Dict[str, Any], output_dir: str, max_workers: Optional[int] = None
+) -> List[str]:
     """
     Gera PDFs para todas as gerências e os salva em um diretório.
 
+    As gerências são independentes, então os PDFs são gerados em processos
+    (um por gerência, até o número de núcleos), como em
+    ``generate_all_pdfs_streaming``; com até ``PDF_SERIAL_MAX`` PDFs, em
+    sequência.
+
     Args:
         all_analysis_data: Dicionário com análises de todas as gerências.
                            Espera um mapeamento em all_analysis_data["analises"].
         output_dir: Diretório para salvar os PDFs.
+        max_workers: Limite de processos. Padrão: ``os.cpu_count()``.
+                     Com 1 (ou uma única gerência) a geração é sequencial.
 
     Returns:
-        Lista com os caminhos dos PDFs gerados.
+        Lista com os caminhos dos PDFs gerados, na ordem das gerências.
     """
     try:
         if not os.path.exists(output_dir):
             os.makedirs(output_dir, exist_ok=True)
 
-        pdf_paths: List[str] = []
         analises: Dict[str, Dict[str, Any]] = all_analysis_data.get("analises", {}) or {}
+        payloads = [
+            (gerencia, analysis_data, output_dir)
+            for gerencia, analysis_data in analises.items()
+            if (analysis_data or {}).get("status") == "sucesso"
+        ]
 
-        for gerencia, analysis_data in analises.items():
-            if (analysis_data or {}).get("status") == "sucesso":
-                safe_name = _sanitize_filename(gerencia)
-                pdf_filename = f"Relatorio_Estoque_{safe_name}.pdf"
-                pdf_path = os.path.join(output_dir, pdf_filename)
-                generate_pdf_for_gerencia(analysis_data, pdf_path)
-                pdf_paths.append(pdf_path)
+        workers = _pdf_workers(len(payloads), max_workers)
+        if workers <= 1:
+            return [_write_one_pdf(item) for item in payloads]
 
-        return pdf_paths
+        return _pool_map(workers, _write_one_pdf, payloads)
 
     except Exception as e:
         raise Exception(f"Erro ao gerar todos os PDFs: {e}")
@@ -2,14 +2,19 @@
 Funções utilitárias de formatação numérica e monetária.
 """
 
-from typing import Any
+from typing import Any, List, Sequence
+import numpy as np
 import pandas as pd
 
 def safe_format_currency(value: Any) -> str:
     """
     Formata um valor numérico como moeda brasileira.
+    Ausentes (None/NaN) e não numéricos viram "R$ 0,00".
     """
     try:
+        if value is None or value != value:  # NaN é o único valor diferente de si
+            return "R$ 0,00"
+        # Três replace em string curta saem mais baratos que um translate
         return f"R$ {float(value):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     except Exception:
         return "R$ 0,00"
@@ -38,3 +43,70 @@ def format_currency_compact(value: float) -> str:
             return f"R$ {value:.0f}"
     except Exception:
         return "R$ 0"
+
+# Faixas do formato compacto, indexadas pela magnitude (0: unidades, 1: K, 2: M)
+_COMPACT_FMT = np.array(["%.0f", "%.1f", "%.1f"])
+_COMPACT_SUFFIX = np.array(["", "K", "M"])
+
+def _compact_scale(v: np.ndarray):
+    """Valor reescalado e faixa de magnitude de cada elemento de ``v``."""
+    faixa = (v >= 1_000).astype(np.intp) + (v >= 1_000_000)
+    scaled = np.select([faixa == 2, faixa == 1], [v / 1_000_000, v / 1_000], v)
+    return scaled, faixa
+
+def format_currency_compact_array(values: Any) -> List[str]:
+    """
+    Versão vetorizada de ``format_currency_compact`` para uma sequência de
+    valores (lista, array ou Series). NaN vira "R$ 0".
+    """
+    v = np.asarray(values, dtype=float).ravel()
+    v = np.where(np.isnan(v), 0.0, v) + 0.0  # + 0.0 normaliza -0.0
+    scaled, faixa = _compact_scale(v)
+    texto = np.char.mod(_COMPACT_FMT[faixa], scaled)
+    return np.char.add(np.char.add("R$ ", texto), _COMPACT_SUFFIX[faixa]).tolist()
+
+# Troca "," <-> "." do padrão en-US para o padrão brasileiro.
+_BR_SEPARATORS = str.maketrans(",.", ".,")
+
+def _format_currency_floats(num: np.ndarray) -> List[str]:
+    """
+    Formata um array float (sem NaN) como moeda brasileira. Os valores são
+    formatados e unidos numa única string, que passa por um só ``translate``
+    e um só ``split`` (em vez de uma troca de separadores por célula).
+    """
+    if num.size == 0:
+        return []
+    texto = "R$ " + "\nR$ ".join(map("{:,.2f}".format, num.tolist()))
+    return texto.translate(_BR_SEPARATORS).split("\n")
+
+def format_currency_series(values: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de ``safe_format_currency`` para uma Series.
+    Valores não numéricos viram "R$ 0,00".
+    """
+    num = pd.to_numeric(values, errors="coerce").fillna(0.0).to_numpy(dtype=float)
+    return pd.Series(_format_currency_floats(num), index=values.index, dtype=object)
+
+def format_currency_list(values: Sequence[Any]) -> List[str]:
+    """
+    Versão de ``format_currency_series`` para uma lista de valores (ex.: uma
+    coluna de registros), sem montar uma Series. Ausentes e não numéricos
+    viram "R$ 0,00".
+    """
+    try:
+        num = np.asarray(values, dtype=float)  # None vira NaN
+    except (TypeError, ValueError):
+        num = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=float)
+    return _format_currency_floats(np.nan_to_num(num, nan=0.0))
+
+def format_number_series(values: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de ``safe_format_number`` para uma Series.
+    Valores não numéricos ou infinitos viram "0".
+    """
+    num = pd.to_numeric(values, errors="coerce").replace([np.inf, -np.inf], 0).fillna(0)
+    if (num.abs() >= 2**63).any():
+        # Fora da faixa do int64: o helper escalar usa o int do Python, sem limite
+        return values.map(safe_format_number)
+    num = num.astype("int64")
+    return num.map("{:,}".format).str.replace(",", ".", regex=False)